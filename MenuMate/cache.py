@@ -0,0 +1,45 @@
+# cache.py
+# Backend for the 'shared' cache: files in one directory every worker process
+# can see, like FileBasedCache, except that culling never removes an entry
+# stored without a timeout.
+#
+# The version tokens kept there for good (catalog, charges, the dashboard's
+# data versions) are what fragment caches and ETags are keyed on; losing one
+# to a random cull silently resets all of them. When the cache is full this
+# backend drops expired entries first, then the entries closest to expiring.
+import pickle
+import time
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class VersionFileCache(FileBasedCache):
+    """FileBasedCache that culls only entries with an expiry."""
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+
+        now = time.time()
+        expiring = []
+        for fname in filelist:
+            try:
+                with open(fname, 'rb') as f:
+                    expiry = pickle.load(f)
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                continue
+            if expiry is None:
+                continue
+            if expiry < now:
+                self._delete(fname)
+                num_entries -= 1
+            else:
+                expiring.append((expiry, fname))
+        if num_entries < self._max_entries:
+            return
+
+        # CULL_FREQUENCY = 0 drops every expiring entry instead of clearing
+        cull = len(expiring) if self._cull_frequency == 0 else num_entries // self._cull_frequency
+        for _, fname in sorted(expiring)[:cull]:
+            self._delete(fname)
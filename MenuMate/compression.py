@@ -0,0 +1,47 @@
+# compression.py
+# Dynamic responses compressed on the way out: brotli when the client takes it
+# and the optional brotli package is installed, gzip otherwise. Small bodies,
+# streams (the event stream must flush as it goes) and binary types are left
+# alone. Collected static files are precompressed instead (staticfiles.py).
+import re
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+from .staticfiles import accepted_encodings, brotli
+
+COMPRESSIBLE_TYPES = re.compile(r'^(text/|application/(json|javascript|xml)|image/svg\+xml)')
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or not COMPRESSIBLE_TYPES.match(response.get('Content-Type', ''))
+            or len(response.content) < settings.COMPRESS_MIN_SIZE
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+            content = brotli.compress(response.content, quality=settings.COMPRESS_BROTLI_QUALITY)
+        elif 'gzip' in accepted:
+            # Random padding in the gzip header, as GZipMiddleware does (BREACH)
+            encoding = 'gzip'
+            content = compress_string(response.content, max_random_bytes=100)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response.headers['Content-Length'] = str(len(content))
+        # The compressed body is a different representation of the same page
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,10 +45,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'MenuMate.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'customer.middleware.table_context_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,6 +86,107 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Short-lived snapshots (order counters) shared by every screen served by a
+# process. Use a shared backend such as Redis when running several workers.
+# 'shared' holds small values every worker process must agree on, such as the
+# menu catalog version; it must be visible to all workers. It keeps a handful
+# of version tokens for good (never culled, see MenuMate/cache.py) plus one
+# version per order polled in the last day; MAX_ENTRIES leaves room for
+# several thousand orders a day before anything with an expiry is culled.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'MenuMate.cache.VersionFileCache',
+        'LOCATION': BASE_DIR / 'cache' / 'shared',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'sessions',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+
+# Tests
+# File-based caches are moved to a temporary directory for each test run.
+
+TEST_RUNNER = 'MenuMate.test_runner.TestRunner'
+
+
+# Sessions
+# Reads come from the 'sessions' cache and writes still reach the database
+# (cached_db); views only write the session when a value changes. The cache has
+# room for every table and staff login of a few weeks; a session culled from
+# it is read back from the database. Set MENUMATE_SESSION_ENGINE=signed_cookies
+# to keep sessions out of the database altogether (tables can then no longer
+# be force-logged-out), or =db for plain database sessions.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('MENUMATE_SESSION_ENGINE', 'cached_db')
+
+SESSION_CACHE_ALIAS = 'sessions'
+
+
+# Kitchen
+# Each station cooks the menu categories listed against it. Pending lines for
+# the same item arriving within KITCHEN_BATCH_WINDOW minutes are cooked together.
+# Delivered orders stay on the kitchen board for KITCHEN_DELIVERED_WINDOW minutes,
+# then move to the paginated kitchen archive.
+
+KITCHEN_STATIONS = {
+    'Grill': ['Bites'],
+    'Bar': ['Brews'],
+}
+
+KITCHEN_BATCH_WINDOW = 5
+
+KITCHEN_DELIVERED_WINDOW = 30
+
+KITCHEN_ARCHIVE_PAGE_SIZE = 25
+
+
+# Payments
+# UPI payee shown on the bill's QR code. Rendered QR images are memoised per
+# process for the last QR_CACHE_SIZE (payee, amount) pairs.
+
+UPI_ID = 'gks28112005@okhdfcbank'
+
+UPI_PAYEE_NAME = 'Cassa Cassandra'
+
+QR_CACHE_SIZE = 256
+
+
+# Table tablet
+# Cart calls resent from the tablet's offline queue with the same
+# Idempotency-Key within IDEMPOTENCY_KEY_TTL seconds get the first response,
+# kept in the database until then.
+
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+
+# Responses
+# Text responses of at least COMPRESS_MIN_SIZE bytes are sent brotli- or
+# gzip-compressed (see MenuMate/compression.py). Pages with version ETags are
+# re-rendered at least every PAGE_ETAG_WINDOW seconds for their time-based parts.
+
+COMPRESS_MIN_SIZE = 1024
+
+COMPRESS_BROTLI_QUALITY = 5
+
+PAGE_ETAG_WINDOW = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -123,9 +227,30 @@ STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
 
+# collectstatic writes fingerprinted, precompressed copies here, and the WSGI
+# app serves them itself (see MenuMate/staticfiles.py)
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'MenuMate.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploaded photos also get resized copies for srcset (see owner/images.py):
+# one per width, in each format Pillow can write. Tiles are shown 400px tall.
+IMAGE_VARIANT_WIDTHS = (200, 400, 800)
+
+IMAGE_VARIANT_FORMATS = ('avif', 'webp')
+
+IMAGE_VARIANT_QUALITY = 75
+
 LOGIN_URL = '/'
 LOGOUT_REDIRECT_URL = '/' 
 
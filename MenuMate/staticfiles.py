@@ -0,0 +1,162 @@
+# staticfiles.py
+# Production static files without a separate web server.
+#
+# collectstatic writes fingerprinted copies (css/casa.3f2a9c1e.css) and, for
+# text assets, gzip and brotli copies next to them. StaticFilesApp wraps the
+# WSGI application and answers /static/ requests straight from STATIC_ROOT:
+# the best encoding the client accepts, an ETag, and a one-year immutable
+# Cache-Control for fingerprinted names. Anything it does not know goes on to
+# Django untouched.
+import gzip
+import json
+import mimetypes
+import os
+from email.utils import formatdate
+from wsgiref.util import FileWrapper
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip copies are made
+    brotli = None
+
+# Worth compressing; images and fonts are compressed already
+COMPRESSIBLE = ('.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico')
+
+# Smaller files gain less than the Content-Encoding header costs
+MIN_COMPRESS_SIZE = 512
+
+# Encodings by preference, with the suffix of their precompressed copies
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=0, must-revalidate'
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Fingerprinted static files plus .gz and .br copies of text assets."""
+
+    def stored_name(self, name):
+        # Before collectstatic has run (development, tests) there is no
+        # manifest: use the plain names rather than failing
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(self.hashed_files) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as original:
+            data = original.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            compressors.append(('.br', lambda data: brotli.compress(data, quality=11)))
+        for suffix, compress in compressors:
+            compressed = compress(data)
+            # Keep a copy only if it is clearly smaller
+            if len(compressed) < len(data) * 0.95:
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(compressed))
+
+
+def accepted_encodings(header):
+    """Content codings a client accepts from its Accept-Encoding header."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q=') and quality[2:].strip() in ('0', '0.0', '0.00', '0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFile:
+    """One file under STATIC_ROOT with its precompressed copies and headers."""
+
+    def __init__(self, path, immutable):
+        self.variants = {}
+        for encoding, suffix in (*ENCODINGS, (None, '')):
+            if os.path.exists(path + suffix):
+                stat = os.stat(path + suffix)
+                self.variants[encoding] = (path + suffix, stat.st_size, f'"{int(stat.st_mtime):x}-{stat.st_size:x}"')
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type == 'application/javascript':
+            self.content_type += '; charset=utf-8'
+        self.last_modified = formatdate(os.stat(path).st_mtime, usegmt=True)
+        self.cache_control = IMMUTABLE if immutable else REVALIDATE
+
+    def pick(self, accept_encoding):
+        accepted = accepted_encodings(accept_encoding)
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return None
+
+
+class StaticFilesApp:
+    """WSGI middleware serving collected static files ahead of ``application``."""
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = str(root or settings.STATIC_ROOT or '')
+        self.prefix = '/' + (prefix or settings.STATIC_URL).strip('/') + '/'
+        self.files = self.scan() if self.root and os.path.isdir(self.root) else {}
+
+    def scan(self):
+        """Index STATIC_ROOT once, so serving never touches the disk to decide."""
+        manifest = os.path.join(self.root, 'staticfiles.json')
+        hashed = set()
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                hashed = set(json.load(f).get('paths', {}).values())
+
+        files = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(('.gz', '.br')):
+                    continue
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+                files[self.prefix + relative] = StaticFile(path, relative in hashed)
+        return files
+
+    def __call__(self, environ, start_response):
+        static = self.files.get(environ.get('PATH_INFO', ''))
+        if static is None or environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+            return self.application(environ, start_response)
+
+        encoding = static.pick(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        path, size, etag = static.variants[encoding]
+        headers = [
+            ('Cache-Control', static.cache_control),
+            ('ETag', etag),
+            ('Last-Modified', static.last_modified),
+        ]
+        if len(static.variants) > 1:
+            headers.append(('Vary', 'Accept-Encoding'))
+
+        if environ.get('HTTP_IF_NONE_MATCH') == etag:
+            start_response('304 Not Modified', headers)
+            return []
+
+        headers += [('Content-Type', static.content_type), ('Content-Length', str(size))]
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+        return file_wrapper(open(path, 'rb'), 64 * 1024)
@@ -0,0 +1,32 @@
+# test_runner.py
+# Runs the tests against throwaway cache directories.
+#
+# The file-based caches live under BASE_DIR/cache, next to the live sessions
+# and version tokens of the development server; tests clear them freely, so
+# each run points every file-based cache at a temporary directory instead.
+import os
+import shutil
+import tempfile
+from django.conf import settings
+from django.core.cache.backends.filebased import FileBasedCache
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.utils.module_loading import import_string
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_dir = tempfile.mkdtemp(prefix='menumate-cache-')
+        test_caches = {}
+        for alias, config in settings.CACHES.items():
+            if issubclass(import_string(config['BACKEND']), FileBasedCache):
+                config = {**config, 'LOCATION': os.path.join(self.cache_dir, alias)}
+            test_caches[alias] = config
+        self.cache_settings = override_settings(CACHES=test_caches)
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -13,4 +13,7 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MenuMate.settings')
 
-application = get_wsgi_application()
+from .staticfiles import StaticFilesApp  # noqa: E402 (needs the settings module set)
+
+# Collected static files are answered before Django sees the request
+application = StaticFilesApp(get_wsgi_application())
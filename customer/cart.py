@@ -0,0 +1,139 @@
+# cart.py
+# The table's cart, kept in the session: a list of lines
+# {'uuid', 'item_id', 'name', 'quantity', 'total', 'ordered', 'order_uuid'}.
+# Shared by the page views and the JSON cart API so both change it the same way.
+import uuid
+from django.db import transaction
+from owner.charges import compute_totals
+from owner.models import Order, VisitBill
+from .orders import bill_lines, place_lines
+
+
+def get_cart(session):
+    return session.get('cart', [])
+
+
+def cart_totals(cart):
+    return compute_totals(sum(line['total'] for line in cart))
+
+
+def save_cart(session, cart):
+    session['cart'] = cart
+    session['total_amount'] = cart_totals(cart)['total']
+
+
+def add_item(session, product, quantity):
+    """
+    Add ``quantity`` of a catalog item. Merges into the item's line if it has
+    not been ordered yet. Returns (line, created).
+    """
+    cart = get_cart(session)
+    for line in cart:
+        if line['item_id'] == product['id'] and not line.get('ordered'):
+            line['quantity'] += quantity
+            line['total'] = round(product['price'] * line['quantity'], 2)
+            created = False
+            break
+    else:
+        line = {
+            'uuid': uuid.uuid4().hex,
+            'name': product['name'],
+            'quantity': quantity,
+            'total': round(product['price'] * quantity, 2),
+            'ordered': False,
+            'item_id': product['id'],
+        }
+        cart.append(line)
+        created = True
+    save_cart(session, cart)
+    return line, created
+
+
+def find_line(session, line_uuid):
+    """The cart line with this uuid if it can still be changed (not yet ordered)."""
+    return next(
+        (line for line in get_cart(session) if line['uuid'] == line_uuid and not line.get('ordered')),
+        None,
+    )
+
+
+def set_quantity(session, line, price, quantity):
+    cart = get_cart(session)
+    line['quantity'] = quantity
+    line['total'] = round(price * quantity, 2)
+    save_cart(session, cart)
+
+
+def remove_line(session, line):
+    save_cart(session, [other for other in get_cart(session) if other['uuid'] != line['uuid']])
+
+
+def place_cart(session, table):
+    """
+    Order every line not ordered yet. Lines for items that went out of stock
+    leave the cart. Returns (order, rejected line names); order is None when
+    nothing was placed.
+    """
+    cart = get_cart(session)
+    unplaced = [line for line in cart if not line.get('ordered')]
+    if not unplaced:
+        return None, []
+
+    order, rejected = place_lines(table, session.get('visit_id'), unplaced)
+    rejected_names = [line['name'] for line in unplaced if line['item_id'] in rejected]
+    if rejected:
+        cart = [line for line in cart if line.get('ordered') or line['item_id'] not in rejected]
+
+    order_uuid = uuid.uuid4().hex
+    for line in cart:
+        if not line.get('ordered'):
+            line['ordered'] = True
+            line['order_uuid'] = order_uuid
+    save_cart(session, cart)
+    return order, rejected_names
+
+
+def cancel_latest_order(session, table):
+    """
+    Cancel the visit's latest order while the kitchen has not started it and
+    take its lines off the cart. Returns True if an order was cancelled.
+    """
+    latest_order = (
+        Order.objects
+        .filter(table_number=table, session_id=session.get('visit_id'), removed=False)
+        .exclude(status__in=['Ready', 'Delivered'])
+        .order_by('-created_at')
+        .first()
+    )
+    if not latest_order or latest_order.status != 'Accept':
+        return False
+
+    # Take its lines off the visit's bill, then delete DB Order and Items
+    with transaction.atomic():
+        if latest_order.session_id:
+            VisitBill.record(
+                table, latest_order.session_id,
+                bill_lines(latest_order.items.select_related('item')), sign=-1,
+            )
+        latest_order.delete()
+
+    # Lines of the newest placed order share its order_uuid
+    cart = get_cart(session)
+    order_uuid = next(
+        (line['order_uuid'] for line in reversed(cart) if line.get('ordered') and 'order_uuid' in line),
+        None,
+    )
+    if order_uuid is not None:
+        save_cart(session, [line for line in cart if line.get('order_uuid') != order_uuid])
+    return True
+
+
+def open_order_status(table, session_id):
+    """Status of the visit's latest order the table is still waiting on, or None."""
+    return (
+        Order.objects.filter(table_number=table, session_id=session_id, removed=False)
+        .exclude(status='Delivered')
+        .order_by('-created_at')
+        .values_list('status', flat=True)
+        .first()
+    )
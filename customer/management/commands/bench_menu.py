@@ -0,0 +1,57 @@
+import timeit
+from django.contrib.auth.models import User
+from django.contrib.messages.storage import default_storage
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from owner.catalog import get_catalog
+from customer.middleware import TableContext
+from customer.views import customer_dashboard, product_view
+
+
+class Command(BaseCommand):
+    help = "Time the customer menu pages with and without the cached menu grid."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=200, help="Renders per measurement.")
+        parser.add_argument('--table', type=int, default=1)
+
+    def handle(self, *args, **options):
+        number, table = options['number'], options['table']
+        catalog = get_catalog()
+        if not catalog.bites:
+            raise CommandError("The menu has no available Bites to open.")
+        product_id = catalog.bites[0]['id']
+        fragment = make_template_fragment_key('menu_grid', [catalog.version])
+        factory = RequestFactory()
+
+        def call(view, *args):
+            # What the middleware stack would have set up, minus the database session
+            request = factory.get('/')
+            request.user = User(username=f'table{table}')
+            request.session = SessionStore()
+            request.session['visit_id'] = 'bench'
+            request._messages = default_storage(request)
+            request.table = TableContext(request)
+            return view(request, *args)
+
+        pages = [
+            ('customer_dashboard', lambda: call(customer_dashboard)),
+            ('product_view', lambda: call(product_view, 'bite', product_id)),
+        ]
+        self.stdout.write(f"{len(catalog.items)} menu items, {number} renders")
+        for name, render in pages:
+            def uncached():
+                cache.delete(fragment)
+                render()
+
+            render()
+            without = timeit.timeit(uncached, number=number)
+            render()
+            with_cache = timeit.timeit(render, number=number)
+            self.stdout.write(
+                f"  {name:20} without fragment cache: {without / number * 1e3:7.3f} ms"
+                f"   with: {with_cache / number * 1e3:7.3f} ms"
+            )
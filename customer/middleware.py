@@ -0,0 +1,69 @@
+# middleware.py
+# Who the table tablet is, worked out once per request: request.table.
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import cached_property
+from owner.models import Order, Payment
+
+
+class TableContext:
+    """
+    The signed-in table and its current visit. Nothing is read until asked
+    for, and each query runs at most once per request; a view that replaces
+    the order or payment can assign the new one back.
+    """
+
+    def __init__(self, request):
+        self._request = request
+
+    @cached_property
+    def number(self):
+        """Table number from a 'table<N>' account, or None for staff accounts."""
+        number = self._request.user.username.removeprefix('table')
+        return int(number) if number.isdigit() else None
+
+    @property
+    def visit_id(self):
+        # Follows the session: views start and end visits mid-request
+        return self._request.session.get('visit_id')
+
+    @cached_property
+    def latest_order(self):
+        """The visit's newest order that has not been removed."""
+        return (
+            Order.objects.filter(table_number=self.number, session_id=self.visit_id, removed=False)
+            .order_by('-created_at')
+            .first()
+        )
+
+    @cached_property
+    def newest_order(self):
+        """The visit's newest order, even if the kitchen has removed it since."""
+        return (
+            Order.objects.filter(table_number=self.number, session_id=self.visit_id)
+            .order_by('-created_at')
+            .first()
+        )
+
+    @cached_property
+    def payment(self):
+        """The visit's newest payment."""
+        return (
+            Payment.objects.filter(table_number=self.number, session_id=self.visit_id)
+            .order_by('-created_at')
+            .first()
+        )
+
+
+@sync_and_async_middleware
+def table_context_middleware(get_response):
+    # Both flavours, so async views such as the order status long-poll stay async
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            request.table = TableContext(request)
+            return await get_response(request)
+    else:
+        def middleware(request):
+            request.table = TableContext(request)
+            return get_response(request)
+    return middleware
@@ -1,3 +1,22 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class IdempotentCall(models.Model):
+    """
+    A cart call sent with an Idempotency-Key and the response it got (see
+    offline.py). The unique (user, key) pair makes claiming a key a single
+    INSERT; ``status`` stays empty while the first call is still running.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    key = models.CharField(max_length=40)
+    status = models.PositiveSmallIntegerField(null=True)
+    content = models.BinaryField(default=b'')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key')]
+        indexes = [models.Index(fields=['user', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.user} {self.key}: {self.status or 'pending'}"
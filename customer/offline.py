@@ -0,0 +1,116 @@
+# offline.py
+# What the table tablet needs to keep working while the Wi-Fi is down.
+#
+# The service worker (templates/sw.js) caches the menu by catalog version: it
+# reads menu_manifest(), stores the page, assets and images listed under a
+# cache named after the version, and drops the caches of older versions. Cart
+# calls made while offline are queued on the tablet and sent again once the
+# connection is back; @idempotent makes a resent call answer with the stored
+# response instead of adding or ordering twice. Responses are kept in the
+# database (IdempotentCall), which never evicts them before they expire.
+import hashlib
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils import timezone
+from .models import IdempotentCall
+
+# Static files every table screen loads
+OFFLINE_ASSETS = (
+    'css/casa.css',
+    'img/logo.png',
+    'img/info.png',
+    'img/tick.png',
+    'img/error2.png',
+    'js/sweetalert2.all.min.js',
+    'js/live.js',
+    'js/cart.js',
+    'js/offline.js',
+)
+
+# A call still unanswered after this long died with its transaction, so
+# nothing it did was kept: the next resend runs it again
+ABANDONED_AFTER = timedelta(minutes=5)
+
+
+def item_images(item):
+    """URLs of the photo of a catalog item and of all its srcset variants."""
+    images = [item['image_url']] if item['image_url'] else []
+    for _, srcset in item['image_sources']:
+        images += [candidate.rsplit(' ', 1)[0] for candidate in srcset.split(', ')]
+    return images
+
+
+def menu_manifest(catalog):
+    """Everything the service worker caches for one catalog version."""
+    items = catalog.bites + catalog.brews
+    return {
+        'version': catalog.version,
+        'cache': f"menu-{catalog.version}",
+        # Product pages change the session when fetched, so they are only
+        # cached as the table visits them
+        'pages': [reverse('customer_dashboard')],
+        'assets': [static(name) for name in OFFLINE_ASSETS],
+        'images': sorted({image for item in items for image in item_images(item)}),
+        'items': [
+            {'id': item['id'], 'name': item['name'], 'price': item['price'], 'category': item['category']}
+            for item in items
+        ],
+    }
+
+
+def idempotent(view):
+    """
+    For POSTs carrying an Idempotency-Key header: the first call runs the view
+    and its response is kept for IDEMPOTENCY_KEY_TTL seconds, and any repeat
+    of the key from the same user gets that response back without running the
+    view again. A repeat arriving while the first call is still running gets a
+    409 with Retry-After, so the tablet tries again later.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(request, *args, **kwargs)
+
+        key = hashlib.sha1(key.encode()).hexdigest()
+        now = timezone.now()
+        calls = IdempotentCall.objects.filter(user=request.user)
+        calls.filter(created_at__lt=now - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)).delete()
+        try:
+            with transaction.atomic():
+                call = IdempotentCall.objects.create(user=request.user, key=key)
+        except IntegrityError:
+            call = calls.filter(key=key).first()
+            if call is not None and call.status is not None:
+                response = HttpResponse(call.content, status=call.status, content_type='application/json')
+                response['Idempotent-Replayed'] = 'true'
+                return response
+            # Take over an abandoned first call; the UPDATE lets only one resend win
+            if call is None or not calls.filter(
+                pk=call.pk, status=None, created_at__lt=now - ABANDONED_AFTER,
+            ).update(created_at=now):
+                response = JsonResponse({'error': "Still being processed, try again."}, status=409)
+                response['Retry-After'] = '1'
+                return response
+
+        try:
+            # The view's changes and the stored response commit together
+            with transaction.atomic():
+                response = view(request, *args, **kwargs)
+                if response.status_code < 500:
+                    call.status = response.status_code
+                    call.content = response.content
+                    call.save(update_fields=['status', 'content'])
+        except Exception:
+            call.delete()
+            raise
+        if response.status_code >= 500:
+            # Nothing was kept: let the retry run the view again
+            call.delete()
+        return response
+    return wrapper
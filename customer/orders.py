@@ -0,0 +1,60 @@
+# orders.py
+# Placing a table's cart as one order.
+from django.db import transaction
+from owner.models import MenuItem, Order, OrderItem, VisitBill
+
+
+def place_lines(table_number, session_id, lines):
+    """
+    Place cart ``lines`` (dicts with 'item_id' and 'quantity') as one order
+    inside a single transaction: the menu items are read with one in_bulk,
+    line totals are worked out in memory and the lines go in with one
+    bulk_create. Lines for items that are gone or out of stock are skipped.
+    The visit's running bill is updated in the same transaction.
+
+    Returns (order, rejected) where ``rejected`` is the set of skipped item
+    ids; ``order`` is None when nothing could be placed.
+    """
+    quantities = {}
+    for line in lines:
+        quantities[line['item_id']] = quantities.get(line['item_id'], 0) + int(line['quantity'])
+
+    with transaction.atomic():
+        items = MenuItem.objects.in_bulk(list(quantities))
+        rejected = {
+            item_id for item_id in quantities
+            if item_id not in items or items[item_id].delete_status != MenuItem.AVAILABLE
+        }
+        accepted = [item_id for item_id in quantities if item_id not in rejected]
+        if not accepted:
+            return None, rejected
+
+        order = Order.objects.create(table_number=table_number, session_id=session_id)
+        # bulk_create skips OrderItem.save() and its post_save event; the
+        # order.created event goes out on commit, when the lines are in.
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                item=items[item_id],
+                quantity=quantities[item_id],
+                total=round(items[item_id].price * quantities[item_id], 2),
+            )
+            for item_id in accepted
+        ])
+        if session_id:
+            VisitBill.record(table_number, session_id, bill_lines(order_items))
+    return order, rejected
+
+
+def bill_lines(order_items):
+    """Order items as the line dicts VisitBill.record takes."""
+    return [
+        {
+            'item_id': line.item_id,
+            'name': line.item.name,
+            'price': line.item.price,
+            'quantity': line.quantity,
+            'total': line.total,
+        }
+        for line in order_items
+    ]
@@ -1,3 +1,320 @@
-from django.test import TestCase
+import hashlib
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.templatetags.static import static
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from owner.catalog import bump_catalog_version, catalog_version, get_catalog
+from owner.charges import current_rates
+from owner.models import Charges, MenuItem, Order, OrderItem, Payment, VisitBill
+from owner.qr import _render, render_qr
+from .middleware import TableContext
+from .models import IdempotentCall
+from .orders import place_lines
 
-# Create your tests here.
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.burger = MenuItem.objects.create(name='Burger', price=120, category='Bites', image='images/burger.png')
+        self.tea = MenuItem.objects.create(name='Tea', price=20, category='Brews', image='images/tea.png')
+        self.client.force_login(User.objects.create_user('table3', password='secret'))
+
+    def test_menu_pages_read_the_snapshot(self):
+        get_catalog()
+        with self.assertNumQueries(0):
+            catalog = get_catalog()
+        self.assertEqual([item['name'] for item in catalog.bites], ['Burger'])
+        self.assertEqual(catalog.get(self.tea.id)['price'], 20)
+
+        response = self.client.get(reverse('product_view', args=['brew', self.tea.id]))
+        self.assertEqual(response.context['product']['name'], 'Tea')
+        self.assertEqual(self.client.get(reverse('product_view', args=['brew', 999])).status_code, 404)
+
+    def test_menu_changes_bump_the_version(self):
+        version = get_catalog().version
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('toggle_availability', args=[self.burger.id]),
+                headers={'X-Requested-With': 'XMLHttpRequest'},
+            )
+        catalog = get_catalog()
+        self.assertNotEqual(catalog.version, version)
+        self.assertEqual(catalog.bites, ())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_menu_item', args=[self.tea.id]))
+        self.assertIsNone(get_catalog().get(self.tea.id))
+
+
+    def test_menu_grid_is_rendered_once_per_version(self):
+        cache.clear()
+        page = self.client.get(reverse('product_view', args=['bite', self.burger.id]))
+        self.assertContains(page, 'data-product="bite-%d"' % self.burger.id)
+        self.assertContains(page, '.menu-link[data-product="bite-%d"]' % self.burger.id)
+
+        # A rename that skips the signals leaves the cached grid as it was
+        MenuItem.objects.filter(id=self.tea.id).update(name='Chai')
+        self.assertNotContains(self.client.get(reverse('customer_dashboard')), 'Chai')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_catalog_version()
+        self.assertContains(self.client.get(reverse('customer_dashboard')), 'Chai')
+
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.items = [
+            MenuItem.objects.create(name=f'Dish {n}', price=10 * n, category='Bites', image='images/dish.png')
+            for n in range(1, 9)
+        ]
+        self.client.force_login(User.objects.create_user('table4', password='secret'))
+
+    def test_eight_lines_cost_constant_queries(self):
+        lines = [{'item_id': item.id, 'quantity': 2} for item in self.items]
+        current_rates()
+        # Menu items, order, its creation event, the lines and the bill read
+        # and write, plus the savepoint pair the atomic block opens inside the
+        # test transaction
+        with self.assertNumQueries(8):
+            order, rejected = place_lines(4, 'visit', lines)
+        self.assertEqual(rejected, set())
+        self.assertEqual(order.items.count(), 8)
+        self.assertEqual(OrderItem.objects.get(order=order, item=self.items[2]).total, 60)
+
+    def test_out_of_stock_lines_are_rejected(self):
+        sold_out = self.items[0]
+        for item in self.items[:2]:
+            self.client.post(reverse('product_view', args=['bite', item.id]), {'quantity': 1})
+        MenuItem.objects.filter(id=sold_out.id).update(delete_status=MenuItem.OUT_OF_STOCK)
+
+        self.client.post(reverse('place_order'))
+
+        order = Order.objects.get(table_number=4)
+        self.assertEqual([line.item_id for line in order.items.all()], [self.items[1].id])
+        cart = self.client.session['cart']
+        self.assertEqual([(line['item_id'], line['ordered']) for line in cart], [(self.items[1].id, True)])
+
+
+class CartApiTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.burger = MenuItem.objects.create(name='Burger', price=120, category='Bites', image='images/burger.png')
+        self.tea = MenuItem.objects.create(name='Tea', price=20, category='Brews', image='images/tea.png')
+        self.client.force_login(User.objects.create_user('table5', password='secret'))
+        session = self.client.session
+        session['visit_id'] = 'visit'
+        session.save()
+
+    def test_add_update_remove(self):
+        response = self.client.post(reverse('cart_add'), {'item_id': self.burger.id, 'quantity': 2})
+        self.assertEqual(response.status_code, 201)
+        line = response.json()['line']
+        data = self.client.post(reverse('cart_add'), {'item_id': self.burger.id}).json()
+        self.assertEqual([(l['name'], l['quantity'], l['total']) for l in data['cart']], [('Burger', 3, 360)])
+
+        data = self.client.post(reverse('cart_update', args=[line]), {'quantity': 1}).json()
+        self.assertEqual(data['totals']['subtotal'], 120)
+        self.assertEqual(self.client.post(reverse('cart_update', args=[line]), {'quantity': 0}).status_code, 400)
+
+        data = self.client.post(reverse('cart_remove', args=[line])).json()
+        self.assertEqual(data['cart'], [])
+        self.assertEqual(self.client.post(reverse('cart_add'), {'item_id': 999}).status_code, 404)
+
+    def test_place_and_cancel(self):
+        self.client.post(reverse('cart_add'), {'item_id': self.tea.id, 'quantity': 2})
+        data = self.client.post(reverse('cart_place')).json()
+        self.assertEqual(data['order_status'], 'Accept')
+        self.assertTrue(data['cart'][0]['ordered'])
+        self.assertEqual(Order.objects.get(id=data['order_id']).items.get().quantity, 2)
+        self.assertEqual(self.client.post(reverse('cart_place')).status_code, 400)
+
+        data = self.client.post(reverse('cart_cancel')).json()
+        self.assertEqual((data['cart'], data['order_status']), ([], None))
+        self.assertFalse(Order.objects.exists())
+
+
+class VisitBillTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        Charges.objects.create(tax=5, service_charge=10)
+        self.burger = MenuItem.objects.create(name='Burger', price=120, category='Bites', image='images/burger.png')
+        self.tea = MenuItem.objects.create(name='Tea', price=20, category='Brews', image='images/tea.png')
+        self.client.force_login(User.objects.create_user('table6', password='secret'))
+        session = self.client.session
+        session['visit_id'] = 'visit'
+        session['last_product_type'] = 'Bites'
+        session['last_product_id'] = self.burger.id
+        session.save()
+
+    def order(self, item, quantity):
+        self.client.post(reverse('cart_add'), {'item_id': item.id, 'quantity': quantity})
+        self.client.post(reverse('cart_place'))
+
+    def test_bill_follows_placed_and_cancelled_orders(self):
+        self.order(self.burger, 1)
+        self.order(self.burger, 2)
+        self.order(self.tea, 3)
+        bill = VisitBill.objects.get(session_id='visit')
+        self.assertEqual(
+            [(line['name'], line['qty'], line['amount']) for line in bill.items()],
+            [('Burger', 3, 360), ('Tea', 3, 60)],
+        )
+        self.assertEqual((bill.subtotal, bill.tax, bill.service_charge, bill.total), (420, 21, 42, 483))
+
+        self.client.post(reverse('cart_cancel'))
+        bill.refresh_from_db()
+        self.assertEqual([line['name'] for line in bill.items()], ['Burger'])
+        self.assertEqual(bill.total, 414)
+
+    def test_pay_after_the_kitchen_removed_the_order(self):
+        self.order(self.tea, 2)
+        Order.objects.filter(session_id='visit').update(status='Delivered', removed=True)
+
+        self.assertEqual(self.client.get(reverse('pay')).status_code, 200)
+        payment = Payment.objects.get(session_id='visit')
+        self.assertEqual((payment.order, payment.total), (Order.objects.get(), 46))
+
+    def test_customer_and_admin_bills_match(self):
+        self.order(self.burger, 1)
+        self.order(self.tea, 2)
+
+        customer = self.client.get(reverse('pay')).context
+        payment = Payment.objects.get(session_id='visit')
+        self.client.force_login(User.objects.create_superuser('owner', password='secret'))
+        admin = self.client.get(reverse('admin_bill', args=[payment.id])).context
+
+        fields = ['items_summary', 'subtotal', 'tax', 'service_charge', 'total']
+        self.assertEqual([customer[f] for f in fields], [admin[f] for f in fields])
+        self.assertEqual(customer['total'], 184)
+
+        # Prices changing after the order do not rewrite what was ordered
+        MenuItem.objects.filter(id=self.tea.id).update(price=30)
+        admin = self.client.get(reverse('admin_bill', args=[payment.id])).context
+        self.assertEqual(admin['total'], 184)
+
+
+class BillQrTests(TestCase):
+    def setUp(self):
+        _render.cache_clear()
+        self.client.force_login(User.objects.create_user('table7', password='secret'))
+        session = self.client.session
+        session['total'] = 184.0
+        session.save()
+
+    def test_bill_links_a_cacheable_image(self):
+        qr_url = self.client.get(reverse('confirm_pay')).context['qr_code']
+        self.assertEqual(qr_url, reverse('bill_qr', args=['184.00', 'png']))
+
+        response = self.client.get(qr_url)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+
+        again = self.client.get(qr_url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get(reverse('bill_qr', args=['184', 'gif'])).status_code, 404)
+
+    def test_renders_are_memoised(self):
+        svg = self.client.get(reverse('bill_qr', args=['184.00', 'svg']))
+        self.assertEqual(svg['Content-Type'], 'image/svg+xml')
+        self.assertEqual(render_qr(settings.UPI_ID, settings.UPI_PAYEE_NAME, 184, 'svg'), svg.content)
+        self.assertEqual(_render.cache_info().hits, 1)
+
+    def test_compressed_image_is_revalidated(self):
+        url = reverse('bill_qr', args=['184.00', 'svg'])
+        svg = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(svg['Content-Encoding'], 'gzip')
+        self.assertTrue(svg['ETag'].startswith('W/'))
+        again = self.client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': svg['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+
+class TableContextTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def table_request(self, username, visit_id='visit'):
+        request = self.factory.get('/')
+        request.user = User(username=username)
+        request.session = {'visit_id': visit_id}
+        return TableContext(request)
+
+    def test_number_comes_from_table_accounts_only(self):
+        self.assertEqual(self.table_request('table12').number, 12)
+        self.assertIsNone(self.table_request('owner').number)
+
+    def test_visit_lookups_run_once(self):
+        order = Order.objects.create(table_number=8, session_id='visit')
+        Order.objects.create(table_number=8, session_id='other')
+        payment = Payment.objects.create(table_number=8, session_id='visit', order=order, subtotal=10)
+        table = self.table_request('table8')
+
+        with self.assertNumQueries(2):
+            for _ in range(3):
+                self.assertEqual(table.latest_order, order)
+                self.assertEqual(table.payment, payment)
+        self.assertIsNone(self.table_request('table8', visit_id='new').payment)
+
+
+class OfflineTabletTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.burger = MenuItem.objects.create(name='Burger', price=120, category='Bites', image='images/burger.png')
+        self.tea = MenuItem.objects.create(name='Tea', price=20, category='Brews', image='images/tea.png')
+        self.client.force_login(User.objects.create_user('table5', password='secret'))
+        session = self.client.session
+        session['visit_id'] = 'visit'
+        session.save()
+
+    @override_settings(PAGE_ETAG_WINDOW=10 ** 9)
+    def test_manifest_lists_the_menu_by_version(self):
+        response = self.client.get(reverse('menu_manifest'))
+        manifest = response.json()
+        self.assertEqual(manifest['cache'], f"menu-{catalog_version()}")
+        self.assertEqual([item['name'] for item in manifest['items']], ['Burger', 'Tea'])
+        self.assertIn(settings.MEDIA_URL + 'images/burger.png', manifest['images'])
+        self.assertIn(static('js/offline.js'), manifest['assets'])
+
+        with self.assertNumQueries(1):
+            again = self.client.get(reverse('menu_manifest'), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_service_worker(self):
+        response = self.client.get(reverse('service_worker'))
+        self.assertEqual(response['Content-Type'], 'application/javascript')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertIn(reverse('menu_manifest'), response.content.decode())
+
+    def test_resent_cart_calls_take_effect_once(self):
+        for _ in range(2):
+            response = self.client.post(reverse('cart_add'), {'item_id': self.tea.id}, headers={'Idempotency-Key': 'add'})
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual([line['quantity'] for line in self.client.get(reverse('cart_api')).json()['cart']], [1])
+
+        placed = [self.client.post(reverse('cart_place'), headers={'Idempotency-Key': 'place'}).json() for _ in range(2)]
+        self.assertEqual(placed[0]['order_id'], placed[1]['order_id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_replays_survive_other_traffic(self):
+        self.client.post(reverse('cart_add'), {'item_id': self.tea.id}, headers={'Idempotency-Key': 'first'})
+        for n in range(400):
+            caches['shared'].add(f'filler:{n}', n, 60)
+        for n in range(20):
+            self.client.post(reverse('cart_add'), {'item_id': self.burger.id}, headers={'Idempotency-Key': f'other-{n}'})
+
+        response = self.client.post(reverse('cart_add'), {'item_id': self.tea.id}, headers={'Idempotency-Key': 'first'})
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        cart = self.client.get(reverse('cart_api')).json()['cart']
+        self.assertEqual([(line['name'], line['quantity']) for line in cart], [('Tea', 1), ('Burger', 20)])
+
+    def test_a_resend_waits_for_the_first_call(self):
+        user = User.objects.get(username='table5')
+        IdempotentCall.objects.create(user=user, key=hashlib.sha1(b'slow').hexdigest())
+        response = self.client.post(reverse('cart_place'), headers={'Idempotency-Key': 'slow'})
+        self.assertEqual((response.status_code, response['Retry-After']), (409, '1'))
+        self.assertFalse(Order.objects.exists())
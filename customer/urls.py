@@ -10,9 +10,18 @@ urlpatterns = [
     path('place_order/', views.place_order, name='place_order'),
     path('delete-item/<str:uuid>/', views.delete_cart_item, name='delete_cart_item'),
     path('confirm-pay/', views.bill_view, name='confirm_pay'),
+    path('confirm-pay/qr/<str:amount>.<str:fmt>', views.bill_qr, name='bill_qr'),
     path('confirm-cash/', views.confirm_cash, name='confirm_cash'),
     path('cancel_order/', views.cancel_order, name='cancel_order'),
     path('complete_order/', views.confirm_pay, name='confirm_payment'),
     path('if-ready/', views.if_ready, name='if_ready'),
     path('Cassa-Cassandra/', views.logo, name='logo'),
-]
\ No newline at end of file
+    path('cart/', views.cart_api, name='cart_api'),
+    path('cart/add/', views.cart_add, name='cart_add'),
+    path('cart/<str:uuid>/update/', views.cart_update, name='cart_update'),
+    path('cart/<str:uuid>/remove/', views.cart_remove, name='cart_remove'),
+    path('cart/place/', views.cart_place, name='cart_place'),
+    path('cart/cancel/', views.cart_cancel, name='cart_cancel'),
+    path('menu/manifest/', views.menu_manifest_view, name='menu_manifest'),
+    path('sw.js', views.service_worker, name='service_worker'),
+]
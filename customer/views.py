@@ -1,107 +1,65 @@
+from django.conf import settings
 from django.shortcuts import render, redirect
-from owner.models import MenuItem, Order, Charges, OrderItem, Payment
+from django.urls import reverse
+from owner.models import Payment, VisitBill
 import uuid
 from django.contrib import messages
-from collections import defaultdict
 from datetime import datetime
-from owner.utils import generate_upi_qr
-from django.http import JsonResponse
+from owner.catalog import get_catalog
+from .cart import (
+    add_item, cancel_latest_order, cart_totals, find_line, get_cart, open_order_status, place_cart,
+    remove_line, set_quantity,
+)
+from owner.qr import CONTENT_TYPES as QR_CONTENT_TYPES, format_amount, qr_etag, render_qr
+from owner.utils import etag_matches, set_session, versioned_etag
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET, require_POST
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
 import json
+from .offline import idempotent, menu_manifest
 
 def logo(request):
     return render(request, 'logo.html')
 
-def calculate_cart_totals(cart):
-    """
-    Calculate subtotal, tax, service charge, and total for a given cart.
-    Cart is a list of dicts: [{'item_id', 'name', 'quantity', 'total', 'ordered', ...}, ...]
-    Returns a dict with all values.
-    """
-    subtotal = sum(item['total'] for item in cart)
-    charges = Charges.objects.first()
-    tax = round(subtotal * (charges.tax / 100), 2) if charges else 0
-    service_charge = round(subtotal * (charges.service_charge / 100), 2) if charges else 0
-    total = round(subtotal + tax + service_charge, 2)
-    
-    return {
-        'subtotal': round(subtotal, 2),
-        'tax': tax,
-        'service_charge': service_charge,
-        'total': total
-    }
-
-
 @login_required
 def customer_dashboard(request):
     if not request.session.get('visit_id'):
         request.session['visit_id'] = uuid.uuid4().hex  # unique per customer
 
-    bites_items = MenuItem.objects.filter(category='Bites', delete_status=MenuItem.AVAILABLE)
-    brews_items = MenuItem.objects.filter(category='Brews', delete_status=MenuItem.AVAILABLE)
+    catalog = get_catalog()
 
     return render(request, 'casa.html', {
-        'bites_items': bites_items,
-        'brews_items': brews_items,
+        'bites_items': catalog.bites,
+        'brews_items': catalog.brews,
+        'catalog_version': catalog.version,
         'enable_idle_redirect': True,
     })
 
 @login_required
 def product_view(request, product_type, product_id):
-    product = MenuItem.objects.get(id=product_id)
-    order_placed = False
+    catalog = get_catalog()
+    product = catalog.get(product_id)
+    if product is None:
+        raise Http404("Menu item not found")
 
     if request.method == 'POST':
         quantity = int(request.POST.get('quantity') or 1)
-
-        cart = request.session.get('cart', [])
-        request.session['customer_name'] = request.session.get('customer_name') or "Guest"
+        set_session(request.session, 'customer_name', request.session.get('customer_name') or "Guest")
 
         # Merge only if same item exists AND not ordered
-        merged = False
-        for item in cart:
-            if item['item_id'] == product.id and not item.get('ordered'):
-                item['quantity'] += quantity
-                item['total'] = round(product.price * item['quantity'], 2)
-                merged = True
-                break
-
-        if not merged:
-            cart.append({
-                'uuid': uuid.uuid4().hex,
-                'name': product.name,
-                'quantity': quantity,
-                'total': round(product.price * quantity, 2),
-                'ordered': False,
-                'item_id': product.id,
-            })
-            order_placed = True
-
-        # Update session totals
-        totals = calculate_cart_totals(cart)
-        request.session['cart'] = cart
-        request.session['total_amount'] = totals['total']
+        add_item(request.session, product, quantity)
 
         return redirect('product_view', product_type=product_type, product_id=product_id)
 
     # Store last visited product
-    request.session['last_product_type'] = product_type
-    request.session['last_product_id'] = product_id
-
-    table = int(request.user.username.replace('table', ''))
-    session_id = request.session.get('visit_id')
+    set_session(request.session, 'last_product_type', product_type)
+    set_session(request.session, 'last_product_id', product_id)
 
-    # Fetch the latest *non-removed* order for this table/session
-    recent_order = (
-        Order.objects.filter(table_number=table, session_id=session_id, removed=False)
-        .exclude(status='Delivered')
-        .order_by('-created_at')
-        .first()
-    )
+    # Status of the latest *non-removed* order for this table/session
+    order_status = open_order_status(request.table.number, request.table.visit_id)
 
-    current_order = Order.objects.filter(session_id=request.session.get('visit_id'), removed=False).last()
+    current_order = request.table.latest_order
     show_popup = False
     if current_order and current_order.status == "Delivered":
         if request.session.get('delivered_shown_for') != current_order.id:
@@ -109,16 +67,16 @@ def product_view(request, product_type, product_id):
             request.session['delivered_shown_for'] = current_order.id
 
     return render(request, 'casa.html', {
-        'bites_items': MenuItem.objects.filter(category='Bites', delete_status=MenuItem.AVAILABLE),
-        'brews_items': MenuItem.objects.filter(category='Brews', delete_status=MenuItem.AVAILABLE),
+        'bites_items': catalog.bites,
+        'brews_items': catalog.brews,
+        'catalog_version': catalog.version,
         'product': product,
         'cart': request.session.get('cart', []),
         'total_amount': request.session.get('total_amount', 0),
-        'selected_product_id': product.id,
+        'selected_product_id': product['id'],
         'selected_product_type': product_type,
         'show_list': True,
-        'order_status': recent_order.status if recent_order else None,
-        'order_placed': order_placed,
+        'order_status': order_status,
         'current_order': current_order,
         'show_popup': show_popup,
     })
@@ -126,40 +84,19 @@ def product_view(request, product_type, product_id):
 
 @login_required
 def place_order(request):
-    cart = request.session.get('cart', [])
-    unplaced_items = [item for item in cart if not item.get('ordered')]
-
     product_type = request.session.get('last_product_type')
     product_id = request.session.get('last_product_id')
-    
-    if not unplaced_items:
-        messages.error(request, "No new items to order.")
-        return redirect('product_view', product_type=product_type, product_id=product_id) if product_type else redirect('customer_dashboard')
-
-    table = int(request.user.username.replace('table', ''))
-    session_id = request.session.get('visit_id')
-
-    order = Order.objects.create(table_number=table, session_id=session_id)
-    order_uuid = uuid.uuid4().hex
+    table = request.table.number
 
-    # Add items to order
-    for item in cart:
-        if not item.get('ordered'):
-            menu_item = MenuItem.objects.get(id=item['item_id'])
-            OrderItem.objects.create(
-                order=order,
-                item=menu_item,
-                quantity=item['quantity']
-            )
-            item['ordered'] = True
-            item['order_uuid'] = order_uuid
+    order, rejected = place_cart(request.session, table)
 
-    # Calculate totals using helper
-    totals = calculate_cart_totals(cart)
-    request.session['cart'] = cart
-    request.session['total_amount'] = totals['total']
-
-    messages.success(request, f"Order placed successfully for Table #{table}!")
+    # Lines for items that went out of stock leave the cart; the rest are ordered
+    if rejected:
+        messages.error(request, f"Sorry, {', '.join(rejected)} just went out of stock and was removed from your cart.")
+    if order is not None:
+        messages.success(request, f"Order placed successfully for Table #{table}!")
+    elif not rejected:
+        messages.error(request, "No new items to order.")
 
     return redirect('product_view', product_type=product_type, product_id=product_id) if product_type else redirect('customer_dashboard')
 
@@ -167,8 +104,8 @@ def place_order(request):
 
 @login_required
 def pay(request):
-    table = int(request.user.username.replace('table', ''))
-    visit_id = request.session.get('visit_id')
+    table = request.table.number
+    visit_id = request.table.visit_id
 
         # Handle AJAX JSON feedback
     if request.method == "POST" and request.headers.get("Content-Type") == "application/json":
@@ -177,7 +114,7 @@ def pay(request):
             rating = data.get("rating")
             feedback_text = data.get("feedback")
 
-            payment = Payment.objects.filter(table_number=table, session_id=visit_id).order_by('-created_at').first()
+            payment = request.table.payment
             if payment:
                 payment.rating = int(rating) if rating else None
                 payment.feedback = feedback_text
@@ -193,61 +130,40 @@ def pay(request):
     product_type = request.session.get('last_product_type')
     product_id = request.session.get('last_product_id')
 
-    orders = Order.objects.filter(
-        table_number=table,
-        session_id=visit_id,
-    ).prefetch_related('items__item')
+    # The visit's running bill, kept up to date as orders are placed and cancelled
+    bill = VisitBill.objects.filter(table_number=table, session_id=visit_id).first()
 
-    if not orders.exists():
+    if not bill or not bill.lines:
         messages.warning(request, "No orders found. Please place an order before generating the bill.")
         return redirect('product_view', product_type=product_type, product_id=product_id)
 
-    # Group items
-    grouped_items = defaultdict(lambda: {'qty': 0, 'price': 0, 'name': ''})
-    for order in orders:
-        for order_item in order.items.all():
-            item = order_item.item
-            grouped_items[item.id]['qty'] += order_item.quantity
-            grouped_items[item.id]['price'] = item.price
-            grouped_items[item.id]['name'] = item.name
-
-    summarized_items = [
-        {
-            'name': v['name'],
-            'price': v['price'],
-            'qty': v['qty'],
-            'amount': round(v['qty'] * v['price'], 2)
-        }
-        for v in grouped_items.values()
-    ]
+    summarized_items = bill.items()
 
     now = datetime.now()
     bill_number = f"#ORD-{table:02d}{now.strftime('%f')[:3]}"
     bill_date = now.strftime("%d/%m/%Y")
     bill_time = now.strftime("%H:%M:%S")
 
-    subtotal = round(sum(i['amount'] for i in summarized_items), 2)
-
-    charges = Charges.objects.first()
-    tax = round(subtotal * (charges.tax / 100), 2) if charges else 0
-    service_charge = round(subtotal * (charges.service_charge / 100), 2) if charges else 0
-    total = round(subtotal + tax + service_charge, 2)
+    subtotal = bill.subtotal
+    tax = bill.tax
+    service_charge = bill.service_charge
+    total = bill.total
 
     # Store in session
-    request.session['total'] = total
-    request.session['bill_number'] = bill_number
-    request.session['bill_date'] = bill_date
-    request.session['bill_time'] = bill_time
+    set_session(request.session, 'total', total)
+    set_session(request.session, 'bill_number', bill_number)
+    set_session(request.session, 'bill_date', bill_date)
+    set_session(request.session, 'bill_time', bill_time)
 
-    payment = Payment.objects.filter(table_number=table, session_id=visit_id).order_by('-created_at').first()
-    order = Order.objects.filter(table_number=table, session_id=visit_id).order_by('-created_at').first()
+    payment = request.table.payment
 
     if not payment:
-        payment = Payment.objects.create(
+        payment = request.table.payment = Payment.objects.create(
             table_number=table,
             session_id=visit_id,
             subtotal=subtotal,
-            order=order,
+            # Delivered orders may already be off the kitchen board
+            order=request.table.newest_order,
             tax=tax,
             service_charge=service_charge,
             total=total,
@@ -256,10 +172,13 @@ def pay(request):
             bill_time=bill_time,
         )
     else:
-        payment.subtotal = subtotal
-        payment.tax = tax
-        payment.service_charge = service_charge
-        payment.total = total
+        # Keep the stored payment in step with the bill when orders changed since
+        if (payment.subtotal, payment.tax, payment.service_charge, payment.total) != (subtotal, tax, service_charge, total):
+            payment.subtotal = subtotal
+            payment.tax = tax
+            payment.service_charge = service_charge
+            payment.total = total
+            payment.save(update_fields=['subtotal', 'tax', 'service_charge', 'total'])
         payment.bill_number = bill_number
         payment.bill_date = bill_date
         payment.bill_time = bill_time
@@ -267,7 +186,6 @@ def pay(request):
     return render(request, 'pay_confirm.html', {
         'product_type': product_type,
         'product_id': product_id,
-        'orders': orders,
         'items_summary': summarized_items,
         'table': table,
         'bill_number': bill_number,
@@ -284,33 +202,27 @@ def pay(request):
 
 @login_required
 def delete_cart_item(request, uuid):
-    cart = request.session.get('cart', [])
-    item_to_delete = next((item for item in cart if item['uuid'] == uuid), None)
+    item_to_delete = find_line(request.session, uuid)
 
     if item_to_delete:
-        cart = [item for item in cart if item['uuid'] != uuid]
-        request.session['cart'] = cart
-        request.session['total_amount'] = sum(item['total'] for item in cart)
+        remove_line(request.session, item_to_delete)
 
         messages.success(request, f"{item_to_delete['name']} removed from cart.")
 
-        if cart:
+        if get_cart(request.session):
             return redirect('product_view', product_type='Bites' if item_to_delete['item_id'] < 100 else 'Brews', product_id=item_to_delete['item_id'])
 
     return redirect('customer_dashboard')
 
 @login_required
 def clear_orders(request):
-    request.session['all_orders'] = []
+    set_session(request.session, 'all_orders', [])
     return redirect('customer_dashboard')
 
 @login_required
 def confirm_cash(request):
     if request.method == 'POST':
-        table = int(request.user.username.replace('table', ''))
-        visit_id = request.session.get('visit_id')
-
-        payment = Payment.objects.filter(table_number=table, session_id=visit_id).order_by('-created_at').first()
+        payment = request.table.payment
         if payment:
             payment.payment_method = Payment.CASH
             payment.is_paid = True
@@ -327,10 +239,7 @@ def confirm_cash(request):
 @login_required
 def bill_view(request):
     if request.method == 'POST':
-        table = int(request.user.username.replace('table', ''))
-        visit_id = request.session.get('visit_id')
-
-        payment = Payment.objects.filter(table_number=table, session_id=visit_id).order_by('-created_at').first()
+        payment = request.table.payment
         if payment:
             payment.payment_method = Payment.ONLINE
             payment.save()
@@ -338,10 +247,8 @@ def bill_view(request):
     table_number = request.session.get('table_number')
     total = request.session.get('total')
 
-    upi_id = "gks28112005@okhdfcbank"  # Replace with your actual UPI ID
-    name = "Cassa Cassandra"
-    
-    qr_code = generate_upi_qr(upi_id, name, total)
+    # The QR image has its own URL per amount so the browser can cache it
+    qr_code = reverse('bill_qr', args=[format_amount(total), 'png']) if total is not None else None
 
     return render(request, 'bill.html', {
         "table": table_number,
@@ -349,13 +256,33 @@ def bill_view(request):
         "qr_code": qr_code,
     })
 
+@login_required
+@require_GET
+def bill_qr(request, amount, fmt):
+    """UPI QR image for an amount. The image never changes for a given URL."""
+    try:
+        float(amount)
+    except ValueError:
+        raise Http404("Unknown amount")
+    if fmt not in QR_CONTENT_TYPES:
+        raise Http404("Unknown format")
+
+    etag = qr_etag(settings.UPI_ID, settings.UPI_PAYEE_NAME, amount)
+    if etag_matches(request, etag):
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(
+            render_qr(settings.UPI_ID, settings.UPI_PAYEE_NAME, amount, fmt),
+            content_type=QR_CONTENT_TYPES[fmt],
+        )
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
 @login_required
 def confirm_pay(request):
     if request.method == 'POST':
-        table = int(request.user.username.replace('table', ''))
-        visit_id = request.session.get('visit_id')
-
-        payment = Payment.objects.filter(table_number=table, session_id=visit_id).order_by('-created_at').first()
+        payment = request.table.payment
         if payment:
             payment.payment_method = Payment.ONLINE
             payment.is_paid = True
@@ -381,46 +308,12 @@ def confirm_pay(request):
 
 @login_required
 def cancel_order(request):
-    table = int(request.user.username.replace('table', ''))
-    session_id = request.session.get('visit_id')
+    table = request.table.number
 
     product_type = request.session.get('last_product_type')
     product_id = request.session.get('last_product_id')
 
-    latest_order = (
-        Order.objects
-        .filter(table_number=table, session_id=session_id, removed=False)
-        .exclude(status__in=['Ready', 'Delivered'])
-        .order_by('-created_at')
-        .first()
-    )
-
-    if latest_order and latest_order.status == 'Accept':
-        # Delete DB Order and Items
-        latest_order.delete()
-
-        # Find the UUID from session cart matching this order
-        cart = request.session.get('cart', [])
-        order_uuid_to_cancel = None
-
-        for item in reversed(cart):
-            if item.get('ordered') and 'order_uuid' in item:
-                order_uuid_to_cancel = item['order_uuid']
-                break
-
-        # Remove only items with that order_uuid
-        new_cart = []
-        restored_total = 0
-
-        for item in cart:
-            if item.get('order_uuid') == order_uuid_to_cancel:
-                continue  # 🔥 skip items from this cancelled order
-            new_cart.append(item)
-            restored_total += item['total']
-
-        request.session['cart'] = new_cart
-        request.session['total_amount'] = restored_total
-
+    if cancel_latest_order(request.session, table):
         messages.success(request, "Order canceled successfully!")
 
     if product_type and product_id:
@@ -432,3 +325,120 @@ def cancel_order(request):
 def if_ready(request):
     messages.warning(request, "Please wait for the order to be ready.")
     return redirect('product_view' , product_type=request.session.get('last_product_type'), product_id=request.session.get('last_product_id'))
+
+
+@login_required
+@require_GET
+@versioned_etag('catalog')
+def menu_manifest_view(request):
+    return JsonResponse(menu_manifest(get_catalog()))
+
+
+@require_GET
+def service_worker(request):
+    response = render(request, 'sw.js', content_type='application/javascript')
+    # Browsers check for a new worker on navigation; never let them skip that
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+# JSON cart API for the table tablet: every call answers with the whole cart,
+# its totals and the status of the order the table is waiting on, so the page
+# redraws the bill without a reload. Calls sent with an Idempotency-Key (the
+# tablet's offline queue) are safe to resend.
+
+def cart_response(request, status=200, **extra):
+    table = request.table.number
+    cart = get_cart(request.session)
+    return JsonResponse({
+        'cart': cart,
+        'totals': cart_totals(cart),
+        'order_status': open_order_status(table, request.session.get('visit_id')),
+        **extra,
+    }, status=status)
+
+
+def posted_quantity(request):
+    try:
+        quantity = int(request.POST.get('quantity') or 1)
+    except ValueError:
+        return None
+    return quantity if quantity > 0 else None
+
+
+@login_required
+@require_GET
+def cart_api(request):
+    return cart_response(request)
+
+
+@login_required
+@require_POST
+@idempotent
+def cart_add(request):
+    item_id = request.POST.get('item_id', '')
+    product = get_catalog().get(int(item_id)) if item_id.isdigit() else None
+    quantity = posted_quantity(request)
+    if product is None or not product['available']:
+        return JsonResponse({'error': 'Item not available'}, status=404)
+    if quantity is None:
+        return JsonResponse({'error': 'Invalid quantity'}, status=400)
+
+    set_session(request.session, 'customer_name', request.session.get('customer_name') or "Guest")
+    line, created = add_item(request.session, product, quantity)
+    return cart_response(request, status=201 if created else 200, line=line['uuid'])
+
+
+@login_required
+@require_POST
+@idempotent
+def cart_update(request, uuid):
+    line = find_line(request.session, uuid)
+    product = get_catalog().get(line['item_id']) if line else None
+    quantity = posted_quantity(request)
+    if product is None:
+        return JsonResponse({'error': 'Line not found'}, status=404)
+    if quantity is None:
+        return JsonResponse({'error': 'Invalid quantity'}, status=400)
+
+    set_quantity(request.session, line, product['price'], quantity)
+    return cart_response(request)
+
+
+@login_required
+@require_POST
+@idempotent
+def cart_remove(request, uuid):
+    line = find_line(request.session, uuid)
+    if line is None:
+        return JsonResponse({'error': 'Line not found'}, status=404)
+
+    remove_line(request.session, line)
+    return cart_response(request, message=f"{line['name']} removed from cart.")
+
+
+@login_required
+@require_POST
+@idempotent
+def cart_place(request):
+    table = request.table.number
+    order, rejected = place_cart(request.session, table)
+    if order is None and not rejected:
+        return cart_response(request, status=400, error="No new items to order.")
+
+    extra = {'order_id': order.id if order else None, 'rejected': rejected}
+    if rejected:
+        extra['error'] = f"Sorry, {', '.join(rejected)} just went out of stock and was removed from your cart."
+    if order is not None:
+        extra['message'] = f"Order placed successfully for Table #{table}!"
+    return cart_response(request, **extra)
+
+
+@login_required
+@require_POST
+@idempotent
+def cart_cancel(request):
+    table = request.table.number
+    if not cancel_latest_order(request.session, table):
+        return cart_response(request, status=409, error="The kitchen has already started this order.")
+    return cart_response(request, message="Order canceled successfully!")
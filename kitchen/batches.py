@@ -0,0 +1,89 @@
+# batches.py
+# Prep batches: identical pending lines from different tables cooked together.
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from owner.models import Order, OrderItem
+from owner.signals import orders_updated
+from owner.utils import station_for_category
+from .utils import station_lines
+
+
+def pending_lines(station=None):
+    """Lines of accepted orders that still need cooking, oldest first."""
+    return (
+        station_lines(station).filter(prepared=False, order__status='Accept', order__removed=False)
+        .select_related('item', 'order')
+        .order_by('order__created_at', 'id')
+    )
+
+
+def build_batches(station=None):
+    """
+    Group pending lines into cook batches: one batch per menu item for every
+    KITCHEN_BATCH_WINDOW minutes of arrivals, counted from the batch's first
+    line. Each batch lists the line ids it covers so completing it only
+    touches what the cook actually saw.
+    """
+    window = timedelta(minutes=settings.KITCHEN_BATCH_WINDOW)
+    open_batches = {}
+    batches = []
+
+    for line in pending_lines(station):
+        line_station = station_for_category(line.item.category)
+        arrived = line.order.created_at
+        batch = open_batches.get(line.item_id)
+        if batch is None or arrived - batch['since'] > window:
+            batch = {
+                'id': f"{line.item_id}-{line.id}",
+                'item_id': line.item_id,
+                'item_name': line.item.name,
+                'station': line_station,
+                'since': arrived,
+                'quantity': 0,
+                'tables': [],
+                'orders': [],
+                'lines': [],
+            }
+            open_batches[line.item_id] = batch
+            batches.append(batch)
+
+        batch['quantity'] += line.quantity
+        batch['lines'].append(line.id)
+        if line.order_id not in batch['orders']:
+            batch['orders'].append(line.order_id)
+        if line.order.table_number not in batch['tables']:
+            batch['tables'].append(line.order.table_number)
+
+    return batches
+
+
+def serialize_batch(batch):
+    return {
+        **batch,
+        'since': timezone.localtime(batch['since']).strftime('%H:%M'),
+        'tables': ", ".join(str(table) for table in sorted(batch['tables'])),
+    }
+
+
+def complete_lines(line_ids):
+    """
+    Mark a batch's lines as cooked and move every order whose lines are now
+    all cooked from Accept to Ready. Returns the ids of those orders.
+    """
+    with transaction.atomic():
+        lines = OrderItem.objects.filter(id__in=line_ids, prepared=False, order__status='Accept')
+        order_ids = set(lines.values_list('order_id', flat=True))
+        lines.update(prepared=True)
+
+        now = timezone.now()
+        Order.objects.filter(id__in=order_ids).update(updated_at=now)
+
+        unprepared = OrderItem.objects.filter(order=OuterRef('pk'), prepared=False)
+        ready = Order.objects.filter(id__in=order_ids, status='Accept').exclude(Exists(unprepared))
+        ready_ids = Order.transition_many(list(ready.values_list('id', flat=True)), 'Accept', 'Ready')
+
+        orders_updated(order_ids.difference(ready_ids))
+    return ready_ids
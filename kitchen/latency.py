@@ -0,0 +1,102 @@
+# latency.py
+# Ticket latency percentiles from the order event log (owner.models.OrderEvent).
+#
+# Every stage time and percentile is computed by the database: a correlated
+# subquery finds when the order entered the stage, and window functions rank
+# the durations inside each group so only the rows that sit on a percentile
+# are fetched.
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import (
+    Count, DurationField, Exists, ExpressionWrapper, F, OuterRef, Q, Subquery, Value, Window,
+)
+from django.db.models.functions import ExtractHour, RowNumber
+from django.utils import timezone
+from owner.models import OrderEvent, OrderItem
+
+PERCENTILES = (50, 90, 99)
+
+# Report stage -> the status that ends it. 'ready' runs from placing the order
+# to Ready, 'deliver' from Ready to Delivered.
+STAGES = {
+    'ready': 'Ready',
+    'deliver': 'Delivered',
+}
+
+
+def stage_durations(to_status, since=None):
+    """
+    One row per order that reached ``to_status``, annotated with ``duration``:
+    the time it spent in the status it left.
+    """
+    entered = (
+        OrderEvent.objects.filter(order=OuterRef('order'), to_status=OuterRef('from_status'))
+        .order_by('-at')
+        .values('at')[:1]
+    )
+    events = OrderEvent.objects.filter(to_status=to_status, order__isnull=False)
+    if since is not None:
+        events = events.filter(at__gte=since)
+    return (
+        events
+        .annotate(entered_at=Subquery(entered))
+        .filter(entered_at__isnull=False)
+        .annotate(duration=ExpressionWrapper(F('at') - F('entered_at'), output_field=DurationField()))
+    )
+
+
+def _rank(p, size):
+    # Nearest-rank percentile position, ceil(size * p / 100), in integers so
+    # the database computes the same value
+    return (size * p + 99) // 100
+
+
+def percentiles(rows, group):
+    """
+    p50/p90/p99 of ``duration`` for every value of the ``group`` expression,
+    in seconds, sorted by group.
+    """
+    ranked = (
+        rows.annotate(
+            group=group,
+            rank=Window(RowNumber(), partition_by=[F('group')], order_by=[F('duration').asc(), F('id').asc()]),
+            size=Window(Count('id'), partition_by=[F('group')]),
+        )
+        .values('group', 'rank', 'size', 'duration')
+    )
+
+    # Only the rows on a percentile rank come back from the database
+    on_rank = Q()
+    for p in PERCENTILES:
+        on_rank |= Q(rank=(F('size') * p + 99) / 100)
+
+    report = {}
+    for row in ranked.filter(on_rank):
+        entry = report.setdefault(row['group'], {'group': row['group'], 'count': row['size']})
+        for p in PERCENTILES:
+            if _rank(p, row['size']) == row['rank']:
+                entry[f'p{p}'] = round(row['duration'].total_seconds(), 1)
+    return [report[key] for key in sorted(report, key=lambda key: (key is None, key))]
+
+
+def latency_report(days=7):
+    """
+    Time-to-ready and time-to-deliver percentiles over the last ``days`` days,
+    broken down by menu item, kitchen station and the hour the order was placed.
+    """
+    since = timezone.now() - timedelta(days=days)
+    report = {}
+    for stage, to_status in STAGES.items():
+        rows = stage_durations(to_status, since)
+
+        by_station = []
+        for station, categories in settings.KITCHEN_STATIONS.items():
+            cooks_here = OrderItem.objects.filter(order=OuterRef('order'), item__category__in=categories)
+            by_station += percentiles(rows.filter(Exists(cooks_here)), Value(station))
+
+        report[stage] = {
+            'item': percentiles(rows, F('order__items__item__name')),
+            'station': by_station,
+            'hour': percentiles(rows, ExtractHour('order__created_at')),
+        }
+    return report
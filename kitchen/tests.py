@@ -1,3 +1,262 @@
-from django.test import TestCase
+from django.core.cache import cache
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from owner.events import bus
+from owner.models import MenuItem, Order, OrderEvent, OrderItem
+from owner.utils import order_counters
+from .batches import build_batches, complete_lines
+from .latency import latency_report
+from .utils import build_kitchen_totals
 
-# Create your tests here.
+
+class KitchenBoardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.burger = MenuItem.objects.create(name='Burger', price=120, category='Bites', image='images/burger.png')
+        self.tea = MenuItem.objects.create(name='Tea', price=20, category='Brews', image='images/tea.png')
+
+    def place(self, table, status='Accept'):
+        order = Order.objects.create(table_number=table, status=status)
+        OrderItem.objects.create(order=order, item=self.burger, quantity=2)
+        OrderItem.objects.create(order=order, item=self.tea, quantity=1)
+        return order
+
+    def test_totals_group_open_orders(self):
+        self.place(2)
+        self.place(11)
+        self.place(5, status='Delivered')
+
+        totals = {row['item_name']: row for row in build_kitchen_totals()}
+        self.assertEqual(totals['Burger']['total_qty'], 4)
+        self.assertEqual(totals['Burger']['tables'], '2, 11')
+        self.assertEqual(totals['Tea']['total_qty'], 2)
+
+    def test_counters_snapshot(self):
+        self.place(1)
+        order = self.place(2, status='Ready')
+        with self.assertNumQueries(1):
+            counters = order_counters()
+        self.assertEqual(counters['pending_count'], 1)
+        self.assertEqual(counters['preparing_count'], 1)
+
+        # Other screens share the snapshot until an order changes
+        with self.assertNumQueries(0):
+            order_counters()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'Delivered'
+            order.save()
+        counters = order_counters()
+        self.assertEqual(counters['preparing_count'], 0)
+        self.assertEqual(counters['completed_count'], 1)
+
+    @override_settings(PAGE_ETAG_WINDOW=10 ** 9)
+    def test_unchanged_board_is_not_modified(self):
+        self.place(1)
+        etag = self.client.get(reverse('kitchen'))['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('kitchen'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place(2)
+        self.assertEqual(self.client.get(reverse('kitchen'), headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_board_query_count_is_constant(self):
+        # Totals, counters, batches, orders, order lines and the menu
+        board_queries = 6
+
+        self.place(1)
+        with self.assertNumQueries(board_queries):
+            self.client.get(reverse('kitchen'))
+
+        for table in range(2, 12):
+            self.place(table)
+        cache.clear()
+        with self.assertNumQueries(board_queries):
+            response = self.client.get(reverse('kitchen'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_board_keeps_recent_deliveries_only(self):
+        old = self.place(1)
+        Order.transition(old.id, 'Accept', 'Ready')
+        Order.transition(old.id, 'Ready', 'Delivered')
+        Order.objects.filter(id=old.id).update(status_changed_at=timezone.now() - timedelta(hours=3))
+        recent = self.place(2)
+        Order.transition(recent.id, 'Accept', 'Ready')
+        Order.transition(recent.id, 'Ready', 'Delivered')
+        open_order = self.place(3)
+
+        board = self.client.get(reverse('kitchen_feed')).json()
+        self.assertEqual(board['live'], [recent.id, open_order.id])
+
+        with self.settings(KITCHEN_ARCHIVE_PAGE_SIZE=1):
+            response = self.client.get(reverse('kitchen_archive'))
+        self.assertEqual(list(response.context['page']), [old])
+        self.assertEqual(response.context['page'].paginator.num_pages, 1)
+
+    def test_bulk_progress_and_remove(self):
+        accepted = self.place(1)
+        ready = self.place(2, status='Ready')
+        delivered = self.place(3, status='Delivered')
+        ids = [accepted.id, ready.id, delivered.id]
+
+        response = self.client.post(
+            reverse('kitchen_bulk_action'), {'action': 'progress', 'expected': 'Accept', 'ids': ids},
+        )
+        self.assertEqual(response.json()['ids'], [accepted.id])
+        self.assertEqual(response.json()['stale'], [ready.id, delivered.id])
+        statuses = dict(Order.objects.values_list('id', 'status'))
+        self.assertEqual(statuses, {accepted.id: 'Ready', ready.id: 'Ready', delivered.id: 'Delivered'})
+
+        Order.objects.filter(id=delivered.id).update(removed=True)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('kitchen_bulk_action'), {'action': 'remove', 'ids': ids + [999]})
+        # Already removed and unknown orders are neither reported nor announced
+        self.assertEqual((response.json()['updated'], response.json()['ids']), (2, [accepted.id, ready.id]))
+        self.assertFalse(Order.objects.filter(removed=False).exists())
+        published = []
+        original = bus.publish
+        bus.publish = lambda type, data, channels: published.append(data['id'])
+        try:
+            for callback in callbacks:
+                callback()
+        finally:
+            bus.publish = original
+        self.assertEqual(sorted(published), [accepted.id, ready.id])
+
+    def test_bulk_stock_and_ajax_toggle(self):
+        ids = [self.burger.id, self.tea.id]
+        self.client.post(reverse('kitchen_bulk_action'), {'action': 'out_of_stock', 'ids': ids})
+        self.assertFalse(MenuItem.objects.filter(delete_status=MenuItem.AVAILABLE).exists())
+
+        response = self.client.post(
+            reverse('toggle_availability', args=[self.tea.id]),
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+        self.assertEqual(response.json(), {'id': self.tea.id, 'delete_status': MenuItem.AVAILABLE})
+
+
+class PrepBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.burger = MenuItem.objects.create(name='Burger', price=120, category='Bites', image='images/burger.png')
+        self.tea = MenuItem.objects.create(name='Tea', price=20, category='Brews', image='images/tea.png')
+
+    def place(self, table, *lines, minutes_ago=0):
+        order = Order.objects.create(table_number=table)
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        for item, quantity in lines:
+            OrderItem.objects.create(order=order, item=item, quantity=quantity)
+        return order
+
+    def test_identical_items_merge_across_tables(self):
+        self.place(1, (self.burger, 2), (self.tea, 1), minutes_ago=3)
+        self.place(2, (self.burger, 4), minutes_ago=1)
+
+        batches = {batch['item_name']: batch for batch in build_batches()}
+        self.assertEqual(batches['Burger']['quantity'], 6)
+        self.assertEqual(batches['Burger']['tables'], [1, 2])
+        self.assertEqual(batches['Burger']['station'], 'Grill')
+        self.assertEqual(batches['Tea']['station'], 'Bar')
+        self.assertEqual([b['item_name'] for b in build_batches(station='Bar')], ['Tea'])
+
+    def test_arrival_window_splits_batches(self):
+        self.place(1, (self.burger, 1), minutes_ago=20)
+        self.place(2, (self.burger, 1), minutes_ago=1)
+        self.assertEqual(len(build_batches()), 2)
+
+    def test_completing_batch_readies_finished_orders(self):
+        burger_only = self.place(1, (self.burger, 2))
+        mixed = self.place(2, (self.burger, 1), (self.tea, 1))
+        batch = next(b for b in build_batches() if b['item_name'] == 'Burger')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ready = complete_lines(batch['lines'])
+
+        self.assertEqual(ready, [burger_only.id])
+        burger_only.refresh_from_db()
+        mixed.refresh_from_db()
+        self.assertEqual(burger_only.status, 'Ready')
+        self.assertEqual(mixed.status, 'Accept')
+        self.assertEqual([b['item_name'] for b in build_batches()], ['Tea'])
+
+
+class StationBoardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        burger = MenuItem.objects.create(name='Burger', price=120, category='Bites', image='images/burger.png')
+        tea = MenuItem.objects.create(name='Tea', price=20, category='Brews', image='images/tea.png')
+        self.mixed = Order.objects.create(table_number=1)
+        OrderItem.objects.create(order=self.mixed, item=burger, quantity=1)
+        OrderItem.objects.create(order=self.mixed, item=tea, quantity=2)
+        self.tea_only = Order.objects.create(table_number=2)
+        OrderItem.objects.create(order=self.tea_only, item=tea, quantity=1)
+
+    def test_station_feed_only_carries_its_lines(self):
+        data = self.client.get(reverse('kitchen_feed'), {'station': 'Grill'}).json()
+        self.assertEqual(data['live'], [self.mixed.id])
+        self.assertEqual(data['orders'][0]['items'], [{'name': 'Burger', 'quantity': 1, 'prepared': False}])
+        self.assertEqual([row['item_name'] for row in data['totals']], ['Burger'])
+        self.assertEqual(data['counters']['pending_count'], 1)
+
+        self.assertEqual(self.client.get(reverse('kitchen_feed'), {'station': 'Pastry'}).status_code, 404)
+
+    def test_order_ready_once_every_station_is_done(self):
+        ids = [self.mixed.id, self.tea_only.id]
+        self.client.post(reverse('kitchen_bulk_action'), {'action': 'prepare', 'station': 'Bar', 'ids': ids})
+        statuses = dict(Order.objects.values_list('id', 'status'))
+        self.assertEqual(statuses, {self.mixed.id: 'Accept', self.tea_only.id: 'Ready'})
+
+        cache.clear()
+        counters = order_counters('Bar')
+        self.assertEqual(counters['pending_count'], 0)
+        self.assertEqual(counters['preparing_count'], 2)
+
+        self.client.post(reverse('kitchen_bulk_action'), {'action': 'prepare', 'station': 'Grill', 'ids': ids})
+        self.mixed.refresh_from_db()
+        self.assertEqual(self.mixed.status, 'Ready')
+
+
+class LatencyReportTests(TestCase):
+    def setUp(self):
+        self.burger = MenuItem.objects.create(name='Burger', price=120, category='Bites', image='images/burger.png')
+        self.tea = MenuItem.objects.create(name='Tea', price=20, category='Brews', image='images/tea.png')
+
+    def serve(self, item, ready_after, delivered_after=None):
+        order = Order.objects.create(table_number=1)
+        OrderItem.objects.create(order=order, item=item, quantity=1)
+        Order.transition(order.id, 'Accept', 'Ready')
+        ready_at = order.created_at + timedelta(seconds=ready_after)
+        OrderEvent.objects.filter(order=order, to_status='Ready').update(at=ready_at)
+        if delivered_after is not None:
+            Order.transition(order.id, 'Ready', 'Delivered')
+            OrderEvent.objects.filter(order=order, to_status='Delivered').update(
+                at=ready_at + timedelta(seconds=delivered_after))
+        return order
+
+    def test_percentiles_by_item_and_station(self):
+        for minutes in range(1, 11):
+            self.serve(self.burger, minutes * 60, delivered_after=30)
+        self.serve(self.tea, 120)
+
+        # Window-ranked in the database: a fixed number of queries however
+        # many events there are
+        with self.assertNumQueries(8):
+            report = latency_report()
+
+        burger = report['ready']['item'][0]
+        self.assertEqual(burger, {'group': 'Burger', 'count': 10, 'p50': 300.0, 'p90': 540.0, 'p99': 600.0})
+        self.assertEqual(report['ready']['item'][1]['p99'], 120.0)
+        self.assertEqual([row['group'] for row in report['ready']['station']], ['Grill', 'Bar'])
+        self.assertEqual(report['deliver']['item'], [
+            {'group': 'Burger', 'count': 10, 'p50': 30.0, 'p90': 30.0, 'p99': 30.0},
+        ])
+        self.assertEqual(sum(row['count'] for row in report['ready']['hour']), 11)
+
+    def test_latency_endpoint(self):
+        self.serve(self.tea, 90)
+        data = self.client.get(reverse('kitchen_latency'), {'days': 1}).json()
+        self.assertEqual(data['stages']['ready']['station'][0]['group'], 'Bar')
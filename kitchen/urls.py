@@ -3,5 +3,11 @@ from . import views
 
 urlpatterns = [
     path('', views.kitchen, name='kitchen'),
+    path('archive/', views.kitchen_archive, name='kitchen_archive'),
+    path('feed/', views.kitchen_feed, name='kitchen_feed'),
+    path('batches/', views.kitchen_batches, name='kitchen_batches'),
+    path('batches/complete/', views.complete_batch, name='complete_batch'),
+    path('latency/', views.kitchen_latency, name='kitchen_latency'),
+    path('bulk/', views.bulk_action, name='kitchen_bulk_action'),
     path('toggle/<int:item_id>/', views.toggle_availability, name='toggle_availability'),
 ]
\ No newline at end of file
@@ -0,0 +1,118 @@
+# utils.py
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Prefetch, Q, Sum
+from django.utils import formats, timezone
+from django.utils.dateparse import parse_datetime
+from owner.models import Order, OrderItem
+
+# Orders touched this long before the client's cursor are sent again, so a
+# transaction that committed late is never skipped. Clients replace cards by id,
+# so re-sending is harmless.
+FEED_CURSOR_SLACK = timedelta(seconds=2)
+
+STATUS_CLASSES = {
+    'Accept': ('status-pending', 'red-btn'),
+    'Ready': ('status-ready', 'yellow-btn'),
+    'Delivered': ('status-delivered', 'green-btn'),
+}
+
+
+def station_lines(station=None):
+    """Order lines a kitchen station cooks; every line without a station."""
+    lines = OrderItem.objects.all()
+    if station is not None:
+        lines = lines.filter(item__category__in=settings.KITCHEN_STATIONS[station])
+    return lines
+
+
+def delivered_cutoff():
+    """Orders delivered before this have left the board for the archive."""
+    return timezone.now() - timedelta(minutes=settings.KITCHEN_DELIVERED_WINDOW)
+
+
+def with_lines(orders, station=None):
+    # Lines and their menu items in one more query; a station only gets its lines
+    if station is not None:
+        orders = orders.filter(id__in=station_lines(station).values('order_id'))
+    return orders.prefetch_related(Prefetch('items', queryset=station_lines(station).select_related('item')))
+
+
+def board_orders(station=None):
+    """
+    Orders on the kitchen board with their lines and menu items, in two
+    queries: every open order plus those delivered in the last
+    KITCHEN_DELIVERED_WINDOW minutes, so the board stays the same size all day.
+    A station board only gets orders it has lines in, and only those lines.
+    """
+    orders = Order.objects.filter(removed=False).filter(
+        Q(status__in=['Accept', 'Ready']) | Q(status='Delivered', status_changed_at__gte=delivered_cutoff())
+    )
+    return with_lines(orders, station).order_by('created_at')
+
+
+def archived_orders(station=None):
+    """Orders that have left the board: removed, or delivered before the window, newest first."""
+    orders = Order.objects.filter(
+        Q(removed=True)
+        | Q(status='Delivered') & (Q(status_changed_at__lt=delivered_cutoff()) | Q(status_changed_at__isnull=True))
+    )
+    return with_lines(orders, station).order_by('-created_at', '-id')
+
+
+def build_kitchen_totals(station=None):
+    """
+    Total quantity of each item still to cook across all non-delivered orders,
+    with the tables that ordered it. One grouped query; returns a flat list for rendering.
+    """
+    rows = (
+        station_lines(station).filter(order__removed=False, prepared=False)
+        .exclude(order__status='Delivered')
+        .values('item__name', 'order__table_number')
+        .annotate(qty=Sum('quantity'))
+        .order_by('item__name', 'order__table_number')
+    )
+
+    item_totals = {}
+    for row in rows:
+        data = item_totals.setdefault(row['item__name'], {'total_qty': 0, 'tables': []})
+        data['total_qty'] += row['qty']
+        data['tables'].append(str(row['order__table_number']))
+
+    return [
+        {
+            'item_name': item_name,
+            'total_qty': data['total_qty'],
+            'tables': ", ".join(data['tables']),
+        }
+        for item_name, data in item_totals.items()
+    ]
+
+
+def serialize_order(order):
+    status_class, button_class = STATUS_CLASSES.get(order.status, ('', ''))
+    return {
+        'id': order.id,
+        'table_number': order.table_number,
+        'status': order.status,
+        'status_class': status_class,
+        'button_class': button_class,
+        'created_at': formats.date_format(timezone.localtime(order.created_at), 'DATETIME_FORMAT'),
+        'items': [
+            {'name': item.item.name, 'quantity': item.quantity, 'prepared': item.prepared}
+            for item in order.items.all()
+        ],
+    }
+
+
+def parse_cursor(value):
+    """
+    Turn the ``since`` cursor sent by the board back into a datetime.
+    Returns None for a missing or malformed cursor, meaning "send everything".
+    """
+    if not value:
+        return None
+    try:
+        return parse_datetime(value)
+    except ValueError:
+        return None
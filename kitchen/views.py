@@ -1,79 +1,226 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from owner.catalog import bump_catalog_version
 from owner.models import MenuItem, Order
+from owner.signals import orders_updated
+from owner.utils import order_counters, versioned_etag
 from django.contrib import messages
 from django.urls import reverse
-from collections import defaultdict
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
 from django.utils import timezone
+from django.views.decorators.http import require_POST
+from .batches import build_batches, complete_lines, serialize_batch
+from .latency import latency_report
+from .utils import (
+    FEED_CURSOR_SLACK, archived_orders, board_orders, build_kitchen_totals, parse_cursor,
+    serialize_order, station_lines,
+)
 
 
+def get_station(request):
+    # Station boards pass ?station=<name>; no station means the whole kitchen
+    station = request.GET.get('station') or request.POST.get('station') or None
+    if station is not None and station not in settings.KITCHEN_STATIONS:
+        raise Http404("Unknown kitchen station")
+    return station
 
+
+@versioned_etag('orders', 'catalog')
 def kitchen(request):
+    station = get_station(request)
     items = MenuItem.objects.all()
+    if station is not None:
+        items = items.filter(category__in=settings.KITCHEN_STATIONS[station])
     search_query = request.GET.get('q', '').strip()
     
     context = {}
     if request.method == 'POST':
         order_id = request.POST.get('order_id')
         action = request.POST.get('action')
-        order = get_object_or_404(Order, id=order_id)
+        expected = request.POST.get('status')
 
         if action == 'progress':
-            if order.status == 'Accept':
-                order.status = 'Ready'
-            elif order.status == 'Ready':
-                order.status = 'Delivered'
-            order.save()
+            # Move from the status this screen showed; if another screen got
+            # there first nothing changes.
+            outcome = Order.transition(order_id, expected, Order.TRANSITIONS.get(expected))
+            if outcome == Order.STALE:
+                messages.warning(request, "That order was already updated on another screen.")
 
         elif action == 'remove':
+            order = get_object_or_404(Order, id=order_id)
             order.removed = True
-            order.save()
+            order.save(update_fields=['removed', 'updated_at'])
 
+        if station is not None:
+            return redirect(f"{reverse('kitchen')}?station={station}")
         return redirect('kitchen')
     
     if search_query:
         items = items.filter(name__icontains=search_query)
 
     # All current visible orders
-    orders = Order.objects.filter(removed=False).order_by('created_at')
+    feed_cursor = timezone.now().isoformat()
+    orders = board_orders(station)
 
     # Total quantity of each item across all non-delivered orders
-    item_totals = defaultdict(lambda: {'total_qty': 0, 'tables': set()})
-
-    for order in orders:
-        if order.status != 'Delivered':
-            for item in order.items.all():
-                name = item.item.name
-                item_totals[name]['total_qty'] += item.quantity
-                item_totals[name]['tables'].add(f"{order.table_number}")
-
-    # Convert to flat list for easy rendering
-    kitchen_totals = []
-    for item_name, data in item_totals.items():
-        kitchen_totals.append({
-            'item_name': item_name,
-            'total_qty': data['total_qty'],
-            'tables': ", ".join(sorted(data['tables'])),
-        })
+    kitchen_totals = build_kitchen_totals(station)
 
     # Stats
-    today = timezone.now().date()
-    pending_count = Order.objects.filter(status='Accept', removed=False).count()
-    preparing_count = Order.objects.filter(status='Ready', removed=False).count()
-    completed_count = Order.objects.filter(status='Delivered', created_at__date=today).count()
+    counters = order_counters(station)
 
     return render(request, 'kitchen2.html', {
         'orders': orders,
-        'pending_count': pending_count,
-        'preparing_count': preparing_count,
-        'completed_count': completed_count,
+        'pending_count': counters['pending_count'],
+        'preparing_count': counters['preparing_count'],
+        'completed_count': counters['completed_count'],
         'kitchen_totals': kitchen_totals,
+        'batches': [serialize_batch(batch) for batch in build_batches(station)],
         'menu_items': items,
         'q': search_query,
+        'feed_cursor': feed_cursor,
+        'station': station,
+        'stations': list(settings.KITCHEN_STATIONS),
+    })
+
+
+@versioned_etag('orders')
+def kitchen_archive(request):
+    # Order history that has left the board, one page at a time
+    station = get_station(request)
+    paginator = Paginator(archived_orders(station), settings.KITCHEN_ARCHIVE_PAGE_SIZE)
+    page = paginator.get_page(request.GET.get('page'))
+    return render(request, 'kitchen_archive.html', {
+        'page': page,
+        'station': station,
+        'stations': list(settings.KITCHEN_STATIONS),
     })
 
 
+def kitchen_feed(request):
+    # Delta feed for the kitchen board: only orders touched since the cursor.
+    # Totals and counters are only recomputed when something actually changed.
+    station = get_station(request)
+    since = parse_cursor(request.GET.get('since'))
+    cursor = timezone.now()
+
+    visible = board_orders(station)
+    live = list(visible.values_list('id', flat=True))
+
+    changed = visible
+    if since is not None:
+        changed = changed.filter(updated_at__gte=since - FEED_CURSOR_SLACK)
+    changed = list(changed)
+
+    data = {
+        'cursor': cursor.isoformat(),
+        'orders': [serialize_order(order) for order in changed],
+        'live': live,
+    }
+
+    # A removed or cancelled order never shows up in `changed`, so compare the
+    # board's card count to notice that the totals moved.
+    try:
+        known = int(request.GET.get('n', -1))
+    except ValueError:
+        known = -1
+    if since is None or changed or known != len(live):
+        data['totals'] = build_kitchen_totals(station)
+        data['batches'] = [serialize_batch(batch) for batch in build_batches(station)]
+        data['counters'] = order_counters(station)
+
+    return JsonResponse(data)
+
+def kitchen_batches(request):
+    station = get_station(request)
+    return JsonResponse({'batches': [serialize_batch(batch) for batch in build_batches(station)]})
+
+
+def kitchen_latency(request):
+    # p50/p90/p99 time-to-ready and time-to-deliver from the order event log
+    try:
+        days = max(1, int(request.GET.get('days', 7)))
+    except ValueError:
+        days = 7
+    return JsonResponse({'days': days, 'stages': latency_report(days)})
+
+
+@require_POST
+def complete_batch(request):
+    # Cook a whole batch in one action: every listed line is marked prepared
+    # and orders with nothing left to cook move to Ready.
+    line_ids = [int(line) for line in request.POST.getlist('line') if line.isdigit()]
+    if not line_ids:
+        return JsonResponse({'error': 'No lines given'}, status=400)
+
+    ready_orders = complete_lines(line_ids)
+    return JsonResponse({'status': 'success', 'ready_orders': ready_orders})
+
+
+@require_POST
+def bulk_action(request):
+    # Progress or remove N orders, or mark N menu items in/out of stock, with
+    # one UPDATE inside a transaction. Answers JSON so the board patches itself.
+    # 'progress' moves orders on from the 'expected' status the screen showed,
+    # so orders another screen already moved are reported as stale. 'prepare'
+    # marks a station's lines of the orders cooked; an order only turns Ready
+    # once every station has finished its part.
+    action = request.POST.get('action')
+    ids = [int(pk) for pk in request.POST.getlist('ids') if pk.isdigit()]
+    if not ids:
+        return JsonResponse({'error': 'No ids given'}, status=400)
+
+    now = timezone.now()
+    with transaction.atomic():
+        if action == 'progress':
+            expected = request.POST.get('expected')
+            to = Order.TRANSITIONS.get(expected)
+            if to is None:
+                return JsonResponse({'error': 'Invalid transition'}, status=400)
+            applied = Order.transition_many(ids, expected, to)
+            return JsonResponse({
+                'status': 'success',
+                'action': action,
+                'updated': len(applied),
+                'ids': applied,
+                'stale': [pk for pk in ids if pk not in applied],
+            })
+        elif action == 'prepare':
+            lines = station_lines(get_station(request)).filter(order_id__in=ids, prepared=False)
+            ready = complete_lines(list(lines.values_list('id', flat=True)))
+            return JsonResponse({'status': 'success', 'action': action, 'ready_orders': ready})
+        elif action == 'remove':
+            # Only orders this UPDATE takes off the board are announced and reported
+            removing = Order.objects.select_for_update().filter(id__in=ids, removed=False)
+            removed = list(removing.values_list('id', flat=True))
+            updated = Order.objects.filter(id__in=removed).update(removed=True, updated_at=now)
+            orders_updated(removed)
+            return JsonResponse({'status': 'success', 'action': action, 'updated': updated, 'ids': removed})
+        elif action in ('in_stock', 'out_of_stock'):
+            status = MenuItem.AVAILABLE if action == 'in_stock' else MenuItem.OUT_OF_STOCK
+            updated = MenuItem.objects.filter(id__in=ids).update(delete_status=status)
+            bump_catalog_version()
+        else:
+            return JsonResponse({'error': 'Unknown action'}, status=400)
+
+    return JsonResponse({'status': 'success', 'action': action, 'updated': updated, 'ids': ids})
+
 
 def toggle_availability(request, item_id):
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        # Flip in place with a single UPDATE and let the page patch the button
+        updated = MenuItem.objects.filter(id=item_id).update(delete_status=Case(
+            When(delete_status=MenuItem.AVAILABLE, then=Value(MenuItem.OUT_OF_STOCK)),
+            default=Value(MenuItem.AVAILABLE),
+        ))
+        if not updated:
+            return JsonResponse({'error': 'Item not found'}, status=404)
+        bump_catalog_version()
+        delete_status = MenuItem.objects.values_list('delete_status', flat=True).get(id=item_id)
+        return JsonResponse({'id': item_id, 'delete_status': delete_status})
+
     item = get_object_or_404(MenuItem, id=item_id)
     category =  request.session.get('category')
     user = request.GET.get('user')
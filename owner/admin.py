@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import MenuItem, Order, OrderItem, Payment, Charges, Employee
+from .models import Blob, MenuItem, Order, OrderItem, Payment, Charges, Employee, VisitBill
 # Register your models here.
 
 admin.site.register(MenuItem)
@@ -8,5 +8,7 @@ admin.site.register(OrderItem)
 admin.site.register(Payment)
 admin.site.register(Charges)
 admin.site.register(Employee)
+admin.site.register(VisitBill)
+admin.site.register(Blob)
 
 
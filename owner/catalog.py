@@ -0,0 +1,61 @@
+# catalog.py
+# Versioned, pre-serialized menu snapshot for the table screens.
+#
+# The catalog version lives in the 'shared' cache so every worker process sees
+# the same one. Each process keeps the snapshot for the current version in
+# memory and only reads MenuItem again after a menu change bumps the version.
+from types import MappingProxyType
+from .images import image_sources
+from .models import MenuItem
+from .utils import bump_shared_version, shared_version
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+# Snapshot built by this process, replaced whenever the version moves on
+_snapshot = None
+
+
+class Catalog:
+    """Read-only menu: every item by id, and the available Bites and Brews."""
+
+    def __init__(self, version, items):
+        self.version = version
+        self.items = MappingProxyType({item['id']: item for item in items})
+        self.bites = tuple(item for item in items if item['available'] and item['category'] == 'Bites')
+        self.brews = tuple(item for item in items if item['available'] and item['category'] == 'Brews')
+
+    def get(self, item_id):
+        return self.items.get(item_id)
+
+
+def serialize_item(item):
+    return MappingProxyType({
+        'id': item.id,
+        'name': item.name,
+        'price': item.price,
+        'category': item.category,
+        'image_url': item.image.url if item.image else '',
+        # (mime type, srcset) per variant format, looked up once per version
+        'image_sources': tuple(image_sources(item.image.name)) if item.image else (),
+        'available': item.delete_status == MenuItem.AVAILABLE,
+    })
+
+
+def catalog_version():
+    return shared_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """Give the menu a new version once the current transaction commits."""
+    bump_shared_version(CATALOG_VERSION_KEY)
+
+
+def get_catalog():
+    """The menu snapshot for the current version, built with one query on a miss."""
+    global _snapshot
+    version = catalog_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        items = [serialize_item(item) for item in MenuItem.objects.order_by('id')]
+        snapshot = _snapshot = Catalog(version, items)
+    return snapshot
@@ -0,0 +1,45 @@
+# charges.py
+# Tax and service-charge rates, cached in process, and the one place bill
+# totals are worked out.
+#
+# Like the menu catalog, the rates carry a version in the 'shared' cache so a
+# change saved through any worker reaches all of them.
+from .models import Charges
+from .utils import bump_shared_version, shared_version
+
+CHARGES_VERSION_KEY = 'charges:version'
+
+# (version, tax %, service charge %) loaded by this process
+_rates = None
+
+
+def current_rates():
+    """Tax and service-charge percentages; one query after each change."""
+    global _rates
+    version = shared_version(CHARGES_VERSION_KEY)
+    rates = _rates
+    if rates is None or rates[0] != version:
+        charges = Charges.objects.first()
+        if charges:
+            rates = (version, charges.tax, charges.service_charge)
+        else:
+            rates = (version, 0, 0)
+        _rates = rates
+    return rates[1], rates[2]
+
+
+def invalidate_charges():
+    bump_shared_version(CHARGES_VERSION_KEY)
+
+
+def compute_totals(subtotal):
+    """Subtotal, tax, service charge and total for a bill, each rounded to paise."""
+    tax_rate, service_rate = current_rates()
+    tax = round(subtotal * (tax_rate / 100), 2)
+    service_charge = round(subtotal * (service_rate / 100), 2)
+    return {
+        'subtotal': round(subtotal, 2),
+        'tax': tax,
+        'service_charge': service_charge,
+        'total': round(subtotal + tax + service_charge, 2),
+    }
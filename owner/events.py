@@ -0,0 +1,133 @@
+# events.py
+# In-process publish/subscribe bus for live order, kitchen and payment updates.
+#
+# Model saves publish small typed events (see signals.py); the SSE view in
+# views.py streams them to subscribers. Every subscriber lives on an asyncio
+# event loop and is fed through ``call_soon_threadsafe``, so publishing from a
+# sync view (which runs in a worker thread under ASGI) is safe. The bus is per
+# process: run the ASGI server with a single worker for live updates, screens
+# fall back to polling otherwise.
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+# Events kept for replay when a screen reconnects with Last-Event-ID
+REPLAY_SIZE = 256
+
+# Events waiting for a slow subscriber before it is told to resync
+QUEUE_SIZE = 500
+
+
+def table_channel(table_number):
+    return f"table:{table_number}"
+
+
+def station_channel(station):
+    return f"station:{station}"
+
+
+class Event:
+    def __init__(self, id, type, data, channels):
+        self.id = id
+        self.type = type
+        self.data = data
+        self.channels = frozenset(channels)
+        self.published_at = time.monotonic()
+
+    def encode(self):
+        # Server-Sent Events wire format
+        payload = json.dumps(self.data, separators=(',', ':'))
+        return f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n"
+
+
+class Subscription:
+    def __init__(self, bus, channels, loop):
+        self.bus = bus
+        self.channels = frozenset(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The screen fell too far behind: drop the backlog and ask it to
+            # reload its state instead of feeding it stale events.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(Event(event.id, 'resync', {}, self.channels))
+
+    async def get(self, timeout=None):
+        """Next event for this subscriber, or None if ``timeout`` expires."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._by_channel = {}
+        self._recent = deque(maxlen=REPLAY_SIZE)
+
+    def subscribe(self, channels, last_event_id=None, loop=None):
+        """
+        Register a subscriber on the running event loop for the given channels.
+        Events newer than ``last_event_id`` still in the replay buffer are
+        queued straight away.
+        """
+        subscription = Subscription(self, channels, loop or asyncio.get_running_loop())
+        with self._lock:
+            for channel in subscription.channels:
+                self._by_channel.setdefault(channel, set()).add(subscription)
+            missed = [
+                event for event in self._recent
+                if last_event_id is not None and event.id > last_event_id
+                and event.channels & subscription.channels
+            ]
+        for event in missed:
+            subscription.queue.put_nowait(event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._by_channel.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._by_channel[channel]
+
+    def publish(self, type, data, channels):
+        with self._lock:
+            event = Event(next(self._ids), type, data, channels)
+            self._recent.append(event)
+            targets = set()
+            for channel in event.channels:
+                targets.update(self._by_channel.get(channel, ()))
+
+        for subscription in targets:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # The subscriber's loop is gone (server shutting down)
+                self.unsubscribe(subscription)
+        return event
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(set().union(*self._by_channel.values())) if self._by_channel else 0
+
+
+bus = EventBus()
@@ -0,0 +1,112 @@
+# images.py
+# Sized, re-encoded copies of uploaded photos for srcset.
+#
+# Each upload gets one variant per width in IMAGE_VARIANT_WIDTHS and per format
+# in IMAGE_VARIANT_FORMATS that this Pillow can write, stored next to the
+# original under variants/. Variants are built after the upload commits, on a
+# background thread, and existing images are backfilled with
+# 'manage.py build_image_variants'. Nothing here touches the database, so the
+# backfill can run it in worker processes.
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+}
+
+logger = logging.getLogger(__name__)
+
+# One worker: variants are a nicety and must not compete with requests for CPU
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-variants')
+
+
+def variant_formats():
+    """Configured variant formats this Pillow can encode, best first."""
+    return [fmt for fmt in settings.IMAGE_VARIANT_FORMATS if features.check(fmt)]
+
+
+def variant_name(name, width, fmt):
+    stem = posixpath.splitext(name)[0]
+    return f"variants/{stem}.{width}w.{fmt}"
+
+
+def variant_paths(name):
+    """Every name a variant of ``name`` could have, whether built or not."""
+    return [
+        variant_name(name, width, fmt)
+        for width in settings.IMAGE_VARIANT_WIDTHS
+        for fmt in MIME_TYPES
+    ]
+
+
+def build_variants(name, force=False):
+    """
+    Write the variants of the stored image ``name``. Images are never scaled
+    up, so a narrow original yields fewer widths. Returns the names written.
+    """
+    formats = variant_formats()
+    with default_storage.open(name) as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+
+    written = []
+    for width in settings.IMAGE_VARIANT_WIDTHS:
+        if width > image.width:
+            break
+        resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        for fmt in formats:
+            target = variant_name(name, width, fmt)
+            if not force and default_storage.exists(target):
+                continue
+            buffer = BytesIO()
+            resized.save(buffer, format=fmt.upper(), quality=settings.IMAGE_VARIANT_QUALITY)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+            written.append(target)
+    return written
+
+
+def image_sources(name):
+    """
+    [(mime type, srcset)] for the variants of ``name`` that exist, best format
+    first; empty until the variants have been built.
+    """
+    sources = []
+    for fmt in variant_formats():
+        candidates = []
+        for width in settings.IMAGE_VARIANT_WIDTHS:
+            target = variant_name(name, width, fmt)
+            if not default_storage.exists(target):
+                break
+            candidates.append(f"{default_storage.url(target)} {width}w")
+        if candidates:
+            sources.append((MIME_TYPES[fmt], ', '.join(candidates)))
+    return sources
+
+
+def _build_in_background(name):
+    from .catalog import bump_catalog_version
+    try:
+        build_variants(name)
+    except Exception:
+        # Nobody reads the future: say why the photo has no variants
+        logger.exception("Could not build the variants of %s", name)
+        return
+    # Table screens pick the new srcset up with the next catalog version
+    bump_catalog_version()
+
+
+def schedule_variants(name):
+    """Build the variants of a new upload once the transaction saving it commits."""
+    transaction.on_commit(lambda: _executor.submit(_build_in_background, name))
@@ -0,0 +1,24 @@
+import timeit
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from owner.qr import _render, make_qr, render_qr
+
+
+class Command(BaseCommand):
+    help = "Time payment QR rendering with and without the per-process memo."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=200, help="Renders per measurement.")
+        parser.add_argument('--format', choices=['png', 'svg'], default='png')
+
+    def handle(self, *args, **options):
+        number, fmt = options['number'], options['format']
+        upi_id, name = settings.UPI_ID, settings.UPI_PAYEE_NAME
+
+        uncached = timeit.timeit(lambda: make_qr(upi_id, name, 184, fmt), number=number)
+        _render.cache_clear()
+        cached = timeit.timeit(lambda: render_qr(upi_id, name, 184, fmt), number=number)
+
+        self.stdout.write(f"{fmt}, {number} renders")
+        self.stdout.write(f"  uncached: {uncached / number * 1e6:10.1f} us/render")
+        self.stdout.write(f"  cached:   {cached / number * 1e6:10.1f} us/render ({_render.cache_info()})")
@@ -0,0 +1,37 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import django
+from django.core.management.base import BaseCommand
+from owner.catalog import bump_catalog_version
+from owner.images import build_variants
+from owner.models import Employee, MenuItem
+
+
+class Command(BaseCommand):
+    help = "Build the srcset variants of every stored menu and employee photo, in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU).")
+        parser.add_argument('--force', action='store_true', help="Rebuild variants that already exist.")
+
+    def handle(self, *args, **options):
+        names = set(MenuItem.objects.exclude(image='').values_list('image', flat=True))
+        names |= set(Employee.objects.exclude(emp_image='').exclude(emp_image=None).values_list('emp_image', flat=True))
+
+        written = failed = 0
+        # Pillow's encoders hold the GIL for much of the work, so use processes
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            jobs = {pool.submit(build_variants, name, options['force']): name for name in sorted(names)}
+            for job in as_completed(jobs):
+                try:
+                    count = len(job.result())
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{jobs[job]}: {e}")
+                else:
+                    written += count
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"{jobs[job]}: {count} variants")
+
+        if written:
+            bump_catalog_version()
+        self.stdout.write(f"{len(names)} images, {written} variants written, {failed} failed")
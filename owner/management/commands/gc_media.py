@@ -0,0 +1,115 @@
+import os
+import posixpath
+from collections import defaultdict
+from datetime import timedelta
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from owner.catalog import bump_catalog_version
+from owner.images import variant_paths
+from owner.models import Blob
+from owner.storage import blob_fields, content_storage, delete_blob, is_blob_name, reference
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete stored photos and variants that no row references. With --rehash, "
+        "first move photos saved under their upload names to content-addressed "
+        "names, folding byte-identical copies into one blob."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rehash', action='store_true', help="Rename legacy uploads by content hash first.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without changing it.")
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help="Leave files younger than this many minutes, which may belong to uploads still committing.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if options['rehash']:
+            self.rehash(dry_run)
+
+        referenced = self.references()
+        keep = set(referenced)
+        for name in referenced:
+            keep.update(variant_paths(name))
+
+        directories = {posixpath.dirname(name) for name in referenced} | {'variants'}
+        cutoff = timezone.now() - timedelta(minutes=options['min_age'])
+        removed = freed = 0
+        for name in self.walk(directories):
+            if name in keep or not content_storage.exists(name) or content_storage.get_modified_time(name) > cutoff:
+                continue
+            size = content_storage.size(name)
+            if not dry_run and not self.sweep(name, cutoff):
+                continue
+            removed += 1
+            freed += size
+            if options['verbosity'] > 1:
+                self.stdout.write(f"orphan: {name}")
+
+        verb = "would remove" if dry_run else "removed"
+        self.stdout.write(f"{len(referenced)} referenced blobs, {verb} {removed} files ({freed / 1024:.0f} KB)")
+
+    def references(self):
+        """Reference count per stored name, over every content-addressed field."""
+        counts = defaultdict(int)
+        for model, field in blob_fields():
+            for name in model._default_manager.exclude(**{field: ''}).values_list(field, flat=True):
+                if name:
+                    counts[name] += 1
+        return counts
+
+    def sweep(self, name, cutoff):
+        if not is_blob_name(name):
+            content_storage.delete(name)
+            return True
+        with transaction.atomic():
+            # A blob stored before counting has no row yet; an upload that
+            # took a reference since the cutoff keeps it
+            Blob.objects.get_or_create(name=name)
+            return delete_blob(name, Q(refs=0) | Q(updated__lt=cutoff))
+
+    def walk(self, directories):
+        for directory in directories:
+            if not content_storage.exists(directory):
+                continue
+            subdirectories, files = content_storage.listdir(directory)
+            for name in files:
+                yield posixpath.join(directory, name)
+            yield from self.walk(posixpath.join(directory, sub) for sub in subdirectories)
+
+    def rehash(self, dry_run):
+        renamed = {}
+        for name in sorted(self.references()):
+            if is_blob_name(name) or not content_storage.exists(name):
+                continue
+            with content_storage.open(name) as content:
+                target = content_storage.hashed_name(name, content)
+                if not dry_run:
+                    content_storage.save(name, content)
+            if not dry_run:
+                # Carry built variants over rather than encoding them again
+                for old, new in zip(variant_paths(name), variant_paths(target)):
+                    if default_storage.exists(old) and not default_storage.exists(new):
+                        with default_storage.open(old) as variant:
+                            default_storage.save(new, variant)
+            renamed[name] = target
+            self.stdout.write(f"{name} -> {os.path.basename(target)}")
+
+        if renamed and not dry_run:
+            with transaction.atomic():
+                for old, new in renamed.items():
+                    rows = sum(
+                        model._default_manager.filter(**{field: old}).update(**{field: new})
+                        for model, field in blob_fields()
+                    )
+                    # save() counted one reference for the rename itself
+                    reference(new, rows - 1)
+            # update() skips the signals that would have moved the menu on
+            bump_catalog_version()
+        self.stdout.write(f"{len(renamed)} uploads {'to rename' if dry_run else 'renamed'} by content hash")
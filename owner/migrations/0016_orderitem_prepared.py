@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('owner', '0015_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='prepared',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('owner', '0017_order_status_changed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, choices=[('Accept', 'Accept'), ('Ready', 'Ready'), ('Delivered', 'Delivered')], max_length=20, null=True)),
+                ('to_status', models.CharField(choices=[('Accept', 'Accept'), ('Ready', 'Ready'), ('Delivered', 'Delivered')], max_length=20)),
+                ('at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', to='owner.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['to_status', 'at'], name='owner_order_to_stat_fbfbe6_idx')],
+            },
+        ),
+    ]
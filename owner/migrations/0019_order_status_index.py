@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('owner', '0018_orderevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'status_changed_at'], name='owner_order_status_50e657_idx'),
+        ),
+    ]
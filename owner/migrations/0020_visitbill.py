@@ -0,0 +1,63 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+def backfill_bills(apps, schema_editor):
+    # Running bills for visits that already have orders
+    OrderItem = apps.get_model('owner', 'OrderItem')
+    Charges = apps.get_model('owner', 'Charges')
+    VisitBill = apps.get_model('owner', 'VisitBill')
+
+    charges = Charges.objects.first()
+    tax_rate = charges.tax if charges else 0
+    service_rate = charges.service_charge if charges else 0
+
+    bills = {}
+    lines = (
+        OrderItem.objects.filter(order__session_id__isnull=False)
+        .select_related('order', 'item')
+        .order_by('order__created_at', 'id')
+    )
+    for line in lines:
+        bill = bills.setdefault(line.order.session_id, VisitBill(
+            table_number=line.order.table_number, session_id=line.order.session_id, lines={},
+        ))
+        entry = bill.lines.setdefault(
+            str(line.item_id), {'name': line.item.name, 'price': line.item.price, 'qty': 0, 'amount': 0},
+        )
+        entry['qty'] += line.quantity
+        entry['amount'] = round(entry['amount'] + line.total, 2)
+
+    for bill in bills.values():
+        subtotal = sum(entry['amount'] for entry in bill.lines.values())
+        bill.subtotal = round(subtotal, 2)
+        bill.tax = round(subtotal * (tax_rate / 100), 2)
+        bill.service_charge = round(subtotal * (service_rate / 100), 2)
+        bill.total = round(subtotal + bill.tax + bill.service_charge, 2)
+    VisitBill.objects.bulk_create(bills.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('owner', '0019_order_status_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitBill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_number', models.PositiveIntegerField()),
+                ('session_id', models.CharField(max_length=100, unique=True)),
+                ('lines', models.JSONField(default=dict)),
+                ('subtotal', models.FloatField(default=0)),
+                ('tax', models.FloatField(default=0)),
+                ('service_charge', models.FloatField(default=0)),
+                ('total', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_bills, migrations.RunPython.noop),
+    ]
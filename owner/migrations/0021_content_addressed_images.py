@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:50
+
+import owner.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('owner', '0020_visitbill'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='employee',
+            name='emp_image',
+            field=models.ImageField(null=True, storage=owner.storage.ContentAddressedStorage(), upload_to='images/'),
+        ),
+        migrations.AlterField(
+            model_name='menuitem',
+            name='image',
+            field=models.ImageField(storage=owner.storage.ContentAddressedStorage(), upload_to='images/'),
+        ),
+    ]
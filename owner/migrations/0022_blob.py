@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:10
+
+from collections import Counter
+from django.db import migrations, models
+from owner.storage import is_blob_name
+
+
+def count_references(apps, schema_editor):
+    # One Blob row per stored photo, counting the rows that use it
+    Blob = apps.get_model('owner', 'Blob')
+    counts = Counter()
+    for model, field in (('MenuItem', 'image'), ('Employee', 'emp_image')):
+        names = apps.get_model('owner', model).objects.exclude(**{field: ''}).values_list(field, flat=True)
+        counts.update(name for name in names if name and is_blob_name(name))
+    Blob.objects.bulk_create([Blob(name=name, refs=refs) for name, refs in counts.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('owner', '0021_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refs', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
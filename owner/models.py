@@ -1,5 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
 from datetime import date
+from .storage import content_storage
+
+# Sent after Order.transition() moves orders with a conditional UPDATE, which
+# skips post_save. Arguments: order_ids, from_status, to_status, at.
+order_transitioned = Signal()
 
 class MenuItem(models.Model):
     AVAILABLE = 1
@@ -14,7 +21,7 @@ class MenuItem(models.Model):
     name = models.CharField(max_length=100)
     price = models.FloatField()
     category = models.CharField(max_length=10, choices=CATEGORY_CHOICES)
-    image = models.ImageField(upload_to='images/')
+    image = models.ImageField(upload_to='images/', storage=content_storage)
     delete_status = models.IntegerField(choices=DELETE_CHOICES, default=AVAILABLE)
 
     def __str__(self):
@@ -26,25 +33,127 @@ class Order(models.Model):
         ('Ready', 'Ready'),
         ('Delivered', 'Delivered'),
     ]
+
+    # Allowed status moves, from -> to
+    TRANSITIONS = {
+        'Accept': 'Ready',
+        'Ready': 'Delivered',
+    }
+
+    # Outcomes of a transition
+    APPLIED = 'applied'
+    STALE = 'stale'
+    INVALID = 'invalid'
+
     session_id = models.CharField(max_length=100, blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Accept')
     table_number = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    status_changed_at = models.DateTimeField(null=True, blank=True)
     removed = models.BooleanField(default=False)
     is_notified = models.BooleanField(default=False)
 
+    class Meta:
+        # The kitchen board reads open orders and recently delivered ones
+        indexes = [models.Index(fields=['status', 'status_changed_at'])]
+
     def __str__(self):
         return f"Order #{self.table_number} at {self.created_at}"
 
+    def save(self, *args, **kwargs):
+        creating = self._state.adding
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if creating:
+                OrderEvent.objects.create(order=self, to_status=self.status, at=self.created_at)
+
     def subtotal(self):
         return sum(item.total for item in self.items.all())
 
+    @classmethod
+    def transition_many(cls, order_ids, expected, to):
+        """
+        Move orders from ``expected`` to ``to`` with one conditional
+        UPDATE ... WHERE status = <expected>, writing only the status columns,
+        and log the move in the same transaction. Orders another screen already
+        moved are left alone. Returns the ids that were moved.
+        """
+        if to is None or cls.TRANSITIONS.get(expected) != to:
+            return []
+
+        now = timezone.now()
+        with transaction.atomic(savepoint=False):
+            updated = cls.objects.filter(id__in=order_ids, status=expected, removed=False).update(
+                status=to, status_changed_at=now, updated_at=now,
+            )
+            if not updated:
+                return []
+
+            if updated == len(order_ids):
+                applied = list(order_ids)
+            else:
+                # The exact timestamp identifies the rows this UPDATE moved
+                applied = list(
+                    cls.objects.filter(id__in=order_ids, status=to, status_changed_at=now)
+                    .values_list('id', flat=True)
+                )
+            OrderEvent.objects.bulk_create([
+                OrderEvent(order_id=order_id, from_status=expected, to_status=to, at=now)
+                for order_id in applied
+            ])
+        order_transitioned.send(
+            sender=cls, order_ids=applied, from_status=expected, to_status=to, at=now,
+        )
+        return applied
+
+    @classmethod
+    def transition(cls, order_id, expected, to):
+        """Move one order; returns APPLIED, STALE or INVALID."""
+        if to is None or cls.TRANSITIONS.get(expected) != to:
+            return cls.INVALID
+        return cls.APPLIED if cls.transition_many([order_id], expected, to) else cls.STALE
+
+    def advance(self):
+        """Move this order one step on from the status it was read with."""
+        to = self.TRANSITIONS.get(self.status)
+        if to is None:
+            return self.INVALID
+        outcome = Order.transition(self.id, self.status, to)
+        if outcome == self.APPLIED:
+            self.status = to
+        return outcome
+
+
+class OrderEvent(models.Model):
+    """
+    Append-only log of order status moves: one row when the order is placed
+    (no ``from_status``) and one per transition. Kitchen latency reports are
+    computed from it.
+    """
+    order = models.ForeignKey(Order, related_name='events', null=True, on_delete=models.SET_NULL)
+    from_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, null=True, blank=True)
+    to_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['to_status', 'at'])]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Order events are append-only")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Order {self.order_id}: {self.from_status} -> {self.to_status} at {self.at}"
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     item = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     total = models.FloatField(default=0.0)
+    prepared = models.BooleanField(default=False)
 
     def save(self, *args, **kwargs):
         self.total = round(self.item.price * self.quantity, 2)
@@ -54,6 +163,59 @@ class OrderItem(models.Model):
         return f"{self.item.name} x {self.quantity}"
 
 
+class VisitBill(models.Model):
+    """
+    Running bill for one table visit: the visit's lines grouped by menu item
+    and its totals, updated as orders are placed and cancelled so opening the
+    bill is a single-row read. ``lines`` maps item id to
+    {'name', 'price', 'qty', 'amount'}.
+    """
+    table_number = models.PositiveIntegerField()
+    session_id = models.CharField(max_length=100, unique=True)
+    lines = models.JSONField(default=dict)
+    subtotal = models.FloatField(default=0)
+    tax = models.FloatField(default=0)
+    service_charge = models.FloatField(default=0)
+    total = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Bill for table {self.table_number} ({self.session_id}): {self.total}"
+
+    def items(self):
+        return list(self.lines.values())
+
+    @classmethod
+    def record(cls, table_number, session_id, lines, sign=1):
+        """
+        Add order lines (dicts with 'item_id', 'name', 'price', 'quantity' and
+        'total') to the visit's bill, or take them off with ``sign=-1``.
+        Run it in the transaction that places or cancels the order.
+        """
+        from .charges import compute_totals
+
+        bill = (
+            cls.objects.select_for_update().filter(session_id=session_id).first()
+            or cls(table_number=table_number, session_id=session_id)
+        )
+        for line in lines:
+            key = str(line['item_id'])
+            entry = bill.lines.setdefault(key, {'name': line['name'], 'price': line['price'], 'qty': 0, 'amount': 0})
+            entry['price'] = line['price']
+            entry['qty'] += sign * line['quantity']
+            entry['amount'] = round(entry['amount'] + sign * line['total'], 2)
+            if entry['qty'] <= 0:
+                del bill.lines[key]
+
+        totals = compute_totals(sum(entry['amount'] for entry in bill.lines.values()))
+        bill.subtotal = totals['subtotal']
+        bill.tax = totals['tax']
+        bill.service_charge = totals['service_charge']
+        bill.total = totals['total']
+        bill.save()
+        return bill
+
+
 class Charges(models.Model):
     tax = models.FloatField()
     service_charge = models.FloatField()
@@ -90,15 +252,11 @@ class Payment(models.Model):
     def save(self, *args, **kwargs):
         # Calculate tax and service charge automatically if not already set
         if self.tax is None or self.service_charge is None or self.total is None:
-            charges = Charges.objects.first()
-            if charges:
-                self.tax = round(self.subtotal * (charges.tax / 100), 2)
-                self.service_charge = round(self.subtotal * (charges.service_charge / 100), 2)
-                self.total = round(self.subtotal + self.tax + self.service_charge, 2)
-            else:
-                self.tax = 0
-                self.service_charge = 0
-                self.total = self.subtotal
+            from .charges import compute_totals
+            totals = compute_totals(self.subtotal)
+            self.tax = totals['tax']
+            self.service_charge = totals['service_charge']
+            self.total = totals['total']
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -117,7 +275,7 @@ class Employee(models.Model):
     ]
 
     name = models.CharField(max_length=100, null=False, blank=False)
-    emp_image = models.ImageField(upload_to='images/',null=True)
+    emp_image = models.ImageField(upload_to='images/', storage=content_storage, null=True)
     date_of_birth = models.DateField(null=False, blank=False)
     phno = models.CharField(max_length=10, null=True, blank=False)
     staff = models.CharField(max_length=10, choices=STAFF_CHOICES, null=False, blank=False)
@@ -132,3 +290,18 @@ class Employee(models.Model):
     class Meta:
         ordering = ['staff', 'name']
 
+
+
+class Blob(models.Model):
+    """
+    Reference count of one content-addressed photo (see storage.py). An
+    upload counts its reference before it checks for the file, and the file is
+    only deleted by the statement that removes this row at zero, so the two
+    cannot interleave.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    refs = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs})"
@@ -0,0 +1,56 @@
+# qr.py
+# UPI payment QR codes. A code depends only on (upi_id, name, amount), so the
+# rendered image is memoised per process and served from its own URL, where the
+# browser can keep it.
+import hashlib
+from functools import lru_cache
+from io import BytesIO
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def format_amount(amount):
+    """Amount as the UPI link carries it, in rupees with two decimals."""
+    return f"{float(amount):.2f}"
+
+
+def upi_url(upi_id, name, amount):
+    return f"upi://pay?pa={upi_id}&pn={name}&am={format_amount(amount)}&cu=INR"
+
+
+def make_qr(upi_id, name, amount, fmt='png'):
+    """Render the payment QR as PNG or SVG bytes. Not cached; see render_qr."""
+    if fmt == 'svg':
+        image = qrcode.make(upi_url(upi_id, name, amount), image_factory=qrcode.image.svg.SvgPathImage)
+        buffer = BytesIO()
+        image.save(buffer)
+    else:
+        image = qrcode.make(upi_url(upi_id, name, amount))
+        buffer = BytesIO()
+        image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=settings.QR_CACHE_SIZE)
+def _render(upi_id, name, amount, fmt):
+    return make_qr(upi_id, name, amount, fmt)
+
+
+def render_qr(upi_id, name, amount, fmt='png'):
+    """
+    Payment QR bytes, memoised per (upi_id, name, amount, format). Amounts are
+    normalised first so 184, 184.0 and '184.00' share one entry.
+    """
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f"Unknown QR format: {fmt}")
+    return _render(upi_id, name, format_amount(amount), fmt)
+
+
+def qr_etag(upi_id, name, amount):
+    return '"' + hashlib.sha1(upi_url(upi_id, name, amount).encode()).hexdigest()[:16] + '"'
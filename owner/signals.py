@@ -0,0 +1,221 @@
+# signals.py
+# Publish live events for order, item and payment changes once they are committed.
+# A changed order also drops the shared counters snapshot and gets a new version
+# (its status ETag); menu items and charges move their caches to a new version.
+# New photo uploads get their srcset variants built after commit, and photos
+# no longer referenced are released from storage. Payments, employees and table
+# logins move the data versions behind the dashboard's ETag.
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .catalog import bump_catalog_version
+from .charges import invalidate_charges
+from .events import bus, station_channel, table_channel
+from .images import schedule_variants
+from .models import Charges, Employee, MenuItem, Order, OrderItem, Payment, order_transitioned
+from .storage import release
+from .utils import bump_data_version, bump_order_versions, invalidate_order_counters, station_for_category
+
+
+def order_payload(order):
+    return {
+        'id': order.id,
+        'table_number': order.table_number,
+        'status': order.status,
+        'removed': order.removed,
+        'is_notified': order.is_notified,
+    }
+
+
+def payment_payload(payment):
+    return {
+        'id': payment.id,
+        'order_id': payment.order_id,
+        'table_number': payment.table_number,
+        'is_paid': payment.is_paid,
+        'notified': payment.notified,
+        'method': 'online' if payment.payment_method == Payment.ONLINE else 'cash',
+    }
+
+
+def publish_on_commit(type, data, channels):
+    transaction.on_commit(lambda: bus.publish(type, data, channels))
+
+
+def order_channels(orders):
+    """
+    Channels interested in each order: kitchen, admin, its table and the
+    kitchen stations that cook its lines. One query for the stations.
+    """
+    channels = {
+        order.id: {'kitchen', 'admin', table_channel(order.table_number)}
+        for order in orders
+    }
+    lines = (
+        OrderItem.objects.filter(order_id__in=channels)
+        .values_list('order_id', 'item__category')
+        .distinct()
+    )
+    for order_id, category in lines:
+        station = station_for_category(category)
+        if station is not None:
+            channels[order_id].add(station_channel(station))
+    return channels
+
+
+def publish_orders(type, orders):
+    channels = order_channels(orders)
+    for order in orders:
+        bus.publish(type, order_payload(order), channels[order.id])
+
+
+def orders_updated(order_ids):
+    """
+    Fan out changes made with QuerySet.update(), which skips post_save:
+    drop the counters snapshot and publish one event per affected order.
+    """
+    order_ids = list(order_ids)
+
+    def publish():
+        invalidate_order_counters()
+        bump_order_versions(order_ids)
+        publish_orders('order.updated', list(Order.objects.filter(id__in=order_ids)))
+
+    if order_ids:
+        transaction.on_commit(publish)
+
+
+@receiver(order_transitioned)
+def order_status_moved(sender, order_ids, **kwargs):
+    orders_updated(order_ids)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, **kwargs):
+    def publish():
+        invalidate_order_counters()
+        bump_order_versions([instance.id])
+        publish_orders('order.created' if created else 'order.updated', [instance])
+
+    transaction.on_commit(publish)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    # The lines are gone with the order, so every station hears about it
+    channels = ['kitchen', 'admin', table_channel(instance.table_number)]
+    channels += [station_channel(station) for station in settings.KITCHEN_STATIONS]
+    order_id = instance.id
+
+    def forget():
+        invalidate_order_counters()
+        bump_order_versions([order_id])
+
+    transaction.on_commit(forget)
+    publish_on_commit('order.deleted', order_payload(instance), channels)
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_saved(sender, instance, created, **kwargs):
+    channels = ['kitchen', 'admin']
+    station = station_for_category(instance.item.category)
+    if station is not None:
+        channels.append(station_channel(station))
+    publish_on_commit(
+        'order.items',
+        {'order_id': instance.order_id, 'item_id': instance.item_id, 'quantity': instance.quantity},
+        channels,
+    )
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, created, **kwargs):
+    bump_data_version('payments')
+    publish_on_commit(
+        'payment.updated',
+        payment_payload(instance),
+        ['admin', table_channel(instance.table_number)],
+    )
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, **kwargs):
+    bump_data_version('payments')
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def employee_changed(sender, instance, **kwargs):
+    bump_data_version('employees')
+
+
+# Table accounts, staff groups and who is logged in
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Session)
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(user_logged_in)
+@receiver(user_logged_out)
+def tables_changed(sender, **kwargs):
+    bump_data_version('tables')
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def menu_item_changed(sender, instance, **kwargs):
+    bump_catalog_version()
+
+
+# Image fields that get srcset variants, per model
+IMAGE_FIELDS = {
+    MenuItem: 'image',
+    Employee: 'emp_image',
+}
+
+
+def release_on_commit(name):
+    transaction.on_commit(lambda: release(name))
+
+
+@receiver(pre_save, sender=MenuItem)
+@receiver(pre_save, sender=Employee)
+def note_new_upload(sender, instance, **kwargs):
+    # A newly assigned upload is not committed to storage until the save runs
+    field = IMAGE_FIELDS[sender]
+    image = getattr(instance, field)
+    instance._new_upload = bool(image) and not image._committed
+    # The photo it replaces loses a reference
+    instance._replaced_image = None
+    if instance._new_upload and instance.pk:
+        instance._replaced_image = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_save, sender=Employee)
+def build_upload_variants(sender, instance, **kwargs):
+    if getattr(instance, '_new_upload', False):
+        instance._new_upload = False
+        schedule_variants(getattr(instance, IMAGE_FIELDS[sender]).name)
+    if getattr(instance, '_replaced_image', None):
+        release_on_commit(instance._replaced_image)
+        instance._replaced_image = None
+
+
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_delete, sender=Employee)
+def release_deleted_image(sender, instance, **kwargs):
+    image = getattr(instance, IMAGE_FIELDS[sender])
+    if image:
+        release_on_commit(image.name)
+
+
+@receiver(post_save, sender=Charges)
+@receiver(post_delete, sender=Charges)
+def charges_changed(sender, instance, **kwargs):
+    invalidate_charges()
@@ -0,0 +1,125 @@
+# storage.py
+# Content-addressed media storage for the photo ImageFields.
+#
+# A file is stored under the SHA-256 of its bytes, so uploading a photo that is
+# already stored writes nothing and both rows point at the one blob. Each blob
+# has a Blob row counting its references: an upload takes one, and a row
+# replacing or deleting its photo gives one back (see release). The last one
+# deletes the blob and its variants, and 'manage.py gc_media' sweeps anything
+# left behind. Since a name always means the same bytes, blobs can be cached
+# by browsers for good.
+#
+# Taking a reference and deleting at zero are each done in one transaction
+# that writes the Blob row before touching the file, so the database orders
+# them: an upload never keeps a file a concurrent release is deleting.
+import hashlib
+import posixpath
+import re
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from .images import variant_paths
+
+BLOB_NAME = re.compile(r'(^|/)[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+
+def is_blob_name(name):
+    return BLOB_NAME.search(name) is not None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names each file by the hash of its content."""
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        extension = posixpath.splitext(name)[1].lower()
+        return posixpath.join(posixpath.dirname(name), digest.hexdigest() + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        with transaction.atomic():
+            # Counted first: a release deleting this blob has either finished,
+            # and the file is written again, or waits for this transaction
+            reference(name)
+            if not self.exists(name):
+                saved = self._save(name, content)
+                if saved != name:
+                    # An identical upload got there first and we were given a
+                    # suffixed name: keep theirs
+                    self.delete(saved)
+        return name
+
+
+content_storage = ContentAddressedStorage()
+
+
+def blob_fields():
+    """(model, field name) for every file field stored content-addressed."""
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, models.FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def refcount(name):
+    """Rows referencing the blob ``name``, across every content-addressed field."""
+    return sum(model._default_manager.filter(**{field: name}).count() for model, field in blob_fields())
+
+
+def reference(name, count=1):
+    """Count ``count`` more references to the blob ``name``."""
+    Blob = apps.get_model('owner', 'Blob')
+    if Blob.objects.filter(name=name).update(refs=F('refs') + count, updated=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            Blob.objects.create(name=name, refs=count)
+    except IntegrityError:
+        # Created by an upload of the same bytes in the meantime
+        Blob.objects.filter(name=name).update(refs=F('refs') + count, updated=timezone.now())
+
+
+def delete_blob(name, condition):
+    """
+    Delete the blob ``name`` and its variants if its Blob row matches
+    ``condition``. The DELETE of the row decides, and holds it until the files
+    are gone. Run inside transaction.atomic.
+    """
+    Blob = apps.get_model('owner', 'Blob')
+    if not Blob.objects.filter(condition, name=name).delete()[0]:
+        return False
+    rows = refcount(name)
+    if rows:
+        # References the count missed, such as a name copied from another row
+        Blob.objects.create(name=name, refs=rows)
+        return False
+    for path in [name, *variant_paths(name)]:
+        content_storage.delete(path)
+    return True
+
+
+def release(name):
+    """
+    Give back one reference to the blob ``name``, deleting it and its variants
+    if that was the last. Call once the change that dropped the reference has
+    committed.
+    """
+    if not name or not is_blob_name(name):
+        return False
+    Blob = apps.get_model('owner', 'Blob')
+    with transaction.atomic():
+        Blob.objects.filter(name=name, refs__gt=0).update(refs=F('refs') - 1, updated=timezone.now())
+        return delete_blob(name, Q(refs=0))
@@ -0,0 +1,13 @@
+from django import template
+from owner import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_sources(image):
+    """
+    [(mime type, srcset)] for an ImageField's variants, for <picture> sources:
+    {% image_sources employee.emp_image as sources %}
+    """
+    return images.image_sources(image.name) if image else []
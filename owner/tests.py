@@ -1,3 +1,520 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import os
+import statistics
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from MenuMate.cache import VersionFileCache
+from MenuMate.staticfiles import StaticFilesApp
+from .catalog import get_catalog
+from .charges import compute_totals
+from .events import EventBus, bus, table_channel
+from .images import _executor, build_variants, image_sources, variant_name
+from .models import Blob, Charges, Employee, MenuItem, Order, OrderEvent, Payment
+from .storage import content_storage, is_blob_name, refcount
+from .utils import bump_order_versions
+from .views import serve_media
 
-# Create your tests here.
+
+class EventBusTests(TestCase):
+    def test_fan_out_latency(self):
+        # A few hundred screens subscribed; events published from another
+        # thread, as sync views do under ASGI.
+        subscribers = 300
+        events = 20
+
+        async def run():
+            event_bus = EventBus()
+            subscriptions = [event_bus.subscribe(['kitchen']) for _ in range(subscribers)]
+            latencies = []
+
+            async def consume(subscription):
+                for _ in range(events):
+                    event = await subscription.get(timeout=5)
+                    latencies.append(time.monotonic() - event.published_at)
+
+            def produce():
+                for i in range(events):
+                    event_bus.publish('order.updated', {'id': i}, ['kitchen'])
+
+            consumers = asyncio.gather(*(consume(s) for s in subscriptions))
+            threading.Thread(target=produce).start()
+            await consumers
+            return latencies
+
+        latencies = asyncio.run(run())
+        self.assertEqual(len(latencies), subscribers * events)
+        p99 = statistics.quantiles(latencies, n=100)[98]
+        self.assertLess(p99, 1.0)
+
+    def test_channel_filtering(self):
+        async def run():
+            event_bus = EventBus()
+            table_1 = event_bus.subscribe([table_channel(1)])
+            kitchen = event_bus.subscribe(['kitchen'])
+            event_bus.publish('order.updated', {'id': 1}, ['kitchen', table_channel(2)])
+            return await table_1.get(timeout=0.1), await kitchen.get(timeout=0.1)
+
+        table_event, kitchen_event = asyncio.run(run())
+        self.assertIsNone(table_event)
+        self.assertEqual(kitchen_event.data, {'id': 1})
+
+    def test_replay_after_reconnect(self):
+        async def run():
+            event_bus = EventBus()
+            first = event_bus.publish('order.created', {'id': 1}, ['kitchen'])
+            event_bus.publish('order.created', {'id': 2}, ['kitchen'])
+            subscription = event_bus.subscribe(['kitchen'], last_event_id=first.id)
+            return await subscription.get(timeout=0.1)
+
+        self.assertEqual(asyncio.run(run()).data, {'id': 2})
+
+    def test_order_save_publishes_after_commit(self):
+        published = []
+        original = bus.publish
+        bus.publish = lambda type, data, channels: published.append((type, data, set(channels)))
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                order = Order.objects.create(table_number=4, session_id='visit')
+        finally:
+            bus.publish = original
+
+        self.assertEqual(published[0][0], 'order.created')
+        self.assertEqual(published[0][1]['id'], order.id)
+        self.assertEqual(published[0][2], {'kitchen', 'admin', 'table:4'})
+
+
+class OrderStateMachineTests(TestCase):
+    def test_transition_outcomes(self):
+        order = Order.objects.create(table_number=1)
+
+        self.assertEqual(Order.transition(order.id, 'Accept', 'Delivered'), Order.INVALID)
+        self.assertEqual(Order.transition(order.id, None, None), Order.INVALID)
+        self.assertEqual(Order.transition(order.id, 'Accept', 'Ready'), Order.APPLIED)
+        # A second screen pressing "progress" on the same card
+        self.assertEqual(Order.transition(order.id, 'Accept', 'Ready'), Order.STALE)
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Ready')
+        self.assertIsNotNone(order.status_changed_at)
+
+    def test_transition_is_single_conditional_update(self):
+        order = Order.objects.create(table_number=1)
+        # The conditional UPDATE and the event log insert
+        with self.assertNumQueries(2):
+            self.assertEqual(order.advance(), Order.APPLIED)
+        self.assertEqual(order.status, 'Ready')
+
+    def test_transitions_are_logged(self):
+        order = Order.objects.create(table_number=1)
+        order.advance()
+        order.advance()
+        # A stale move changes nothing, so it logs nothing
+        Order.transition(order.id, 'Accept', 'Ready')
+
+        events = list(order.events.order_by('id').values_list('from_status', 'to_status'))
+        self.assertEqual(events, [(None, 'Accept'), ('Accept', 'Ready'), ('Ready', 'Delivered')])
+        self.assertEqual(order.events.first().at, order.created_at)
+        with self.assertRaises(ValueError):
+            order.events.first().save()
+
+        # The log outlives the order, for the latency reports
+        order.delete()
+        self.assertEqual(OrderEvent.objects.filter(order=None).count(), 3)
+
+    def test_transition_publishes_after_commit(self):
+        order = Order.objects.create(table_number=6)
+        published = []
+        original = bus.publish
+        bus.publish = lambda type, data, channels: published.append((type, data))
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                Order.transition(order.id, 'Accept', 'Ready')
+        finally:
+            bus.publish = original
+
+        self.assertEqual(published, [('order.updated', {
+            'id': order.id, 'table_number': 6, 'status': 'Ready', 'removed': False, 'is_notified': False,
+        })])
+
+
+class ChargesTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+
+    def test_compute_totals(self):
+        self.assertEqual(compute_totals(100), {'subtotal': 100, 'tax': 0, 'service_charge': 0, 'total': 100})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Charges.objects.create(tax=5, service_charge=2.5)
+        self.assertEqual(
+            compute_totals(333.333),
+            {'subtotal': 333.33, 'tax': 16.67, 'service_charge': 8.33, 'total': 358.33},
+        )
+        # Rates stay in memory until they change
+        with self.assertNumQueries(0):
+            compute_totals(10)
+
+        order = Order.objects.create(table_number=2)
+        payment = Payment.objects.create(
+            order=order, table_number=2, subtotal=200, bill_number='#1', bill_date='', bill_time='',
+        )
+        self.assertEqual((payment.tax, payment.service_charge, payment.total), (10, 5, 215))
+
+    def test_admin_update_reaches_totals(self):
+        Charges.objects.create(tax=5, service_charge=0)
+        self.client.force_login(User.objects.create_superuser('owner', password='secret'))
+        compute_totals(100)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin_dashboard'), {'update_charges': '1', 'tax': '10', 'service_charge': '0'})
+        self.assertEqual(compute_totals(100)['tax'], 10)
+
+
+class SessionWriteBudgetTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        caches['sessions'].clear()
+        self.tea = MenuItem.objects.create(name='Tea', price=20, category='Brews', image='images/tea.png')
+        self.table = User.objects.create_user('table7', password='secret')
+
+    def session_updates(self, url, requests=5):
+        """django_session UPDATEs over ``requests`` identical page views."""
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(requests):
+                self.client.get(url)
+        return sum(1 for query in queries if query['sql'].startswith('UPDATE "django_session"'))
+
+    def test_repeat_views_do_not_rewrite_the_session(self):
+        self.client.force_login(self.table)
+        self.client.get(reverse('customer_dashboard'))
+        self.assertLessEqual(self.session_updates(reverse('product_view', args=['brew', self.tea.id])), 1)
+
+        self.client.force_login(User.objects.create_superuser('owner', password='secret'))
+        self.assertLessEqual(self.session_updates(reverse('admin_dashboard') + '?page=orders'), 1)
+        self.assertEqual(self.session_updates(reverse('check_payment_status')), 0)
+
+    def test_sessions_have_their_own_cache(self):
+        self.client.force_login(self.table)
+        self.client.get(reverse('customer_dashboard'))
+        key = 'django.contrib.sessions.cached_db' + self.client.session.session_key
+        self.assertIsNotNone(caches['sessions'].get(key))
+        self.assertIsNone(caches['shared'].get(key))
+
+    def test_force_logout_reaches_cached_sessions(self):
+        table_client = self.client_class()
+        table_client.force_login(self.table)
+        self.assertEqual(table_client.get(reverse('customer_dashboard')).status_code, 200)
+
+        self.client.force_login(User.objects.create_superuser('owner', password='secret'))
+        self.client.get(reverse('force_logout_user', args=[self.table.id]))
+        self.assertEqual(table_client.get(reverse('customer_dashboard')).status_code, 302)
+
+
+class OrderStatusPollTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.order = Order.objects.create(table_number=3)
+        self.url = reverse('check_order_status', args=[self.order.id])
+
+    def test_unchanged_poll_is_304_without_queries(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json(), {'status': 'Accept', 'is_notified': False})
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        # As sent back for a compressed response
+        response = self.client.get(self.url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': 'W/' + etag})
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.advance()
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.json()['status'], 'Ready')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_change_during_a_cold_read_is_not_hidden(self):
+        def change_after_read(execute, sql, params, many, context):
+            # The order moves on (and gets a new version) right after the poll read it
+            result = execute(sql, params, many, context)
+            if sql.startswith('SELECT') and '"owner_order"' in sql:
+                bump_order_versions([self.order.id])
+            return result
+
+        with connection.execute_wrapper(change_after_read):
+            stale = self.client.get(self.url)
+        self.assertEqual(stale.json()['status'], 'Accept')
+        response = self.client.get(self.url, headers={'If-None-Match': stale['ETag']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_long_poll_returns_on_change_or_timeout(self):
+        etag = self.client.get(self.url)['ETag']
+
+        started = time.monotonic()
+        response = self.client.get(self.url, {'wait': '0.3'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+        threading.Timer(0.2, bump_order_versions, [[self.order.id]]).start()
+        started = time.monotonic()
+        response = self.client.get(self.url, {'wait': '10'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 5)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name, IMAGE_VARIANT_FORMATS=('webp',))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Let variant builds for uploads finish before the directory goes
+        self.addCleanup(lambda: _executor.submit(lambda: None).result())
+
+    def png(self, width, height):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'brown').save(buffer, format='PNG')
+        return SimpleUploadedFile('dish.png', buffer.getvalue(), content_type='image/png')
+
+    def test_upload_gets_variants_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = MenuItem.objects.create(name='Soup', price=90, category='Bites', image=self.png(500, 250))
+        # Jobs run in order on the one worker, so this waits for the build
+        _executor.submit(lambda: None).result()
+
+        names = [variant_name(item.image.name, width, 'webp') for width in (200, 400, 800)]
+        self.assertEqual([default_storage.exists(name) for name in names], [True, True, False])
+        with default_storage.open(names[0]) as variant:
+            self.assertEqual(Image.open(variant).size, (200, 100))
+
+        (sources,) = get_catalog().get(item.id)['image_sources']
+        self.assertEqual(sources[0], 'image/webp')
+        self.assertEqual(sources[1].count('w,'), 1)
+
+    def test_failed_builds_are_logged(self):
+        broken = SimpleUploadedFile('dish.png', b'not a png', content_type='image/png')
+        with self.assertLogs('owner.images', 'ERROR') as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                item = MenuItem.objects.create(name='Soup', price=90, category='Bites', image=broken)
+            _executor.submit(lambda: None).result()
+        self.assertIn(item.image.name, logs.output[0])
+        self.assertEqual(image_sources(item.image.name), [])
+
+    def test_edits_without_a_new_upload_build_nothing(self):
+        name = default_storage.save('images/dish.png', self.png(300, 300))
+        with self.captureOnCommitCallbacks(execute=True):
+            item = MenuItem.objects.create(name='Soup', price=90, category='Bites', image=name)
+            item.price = 95
+            item.save()
+        _executor.submit(lambda: None).result()
+        self.assertEqual(image_sources(name), [])
+
+        self.assertEqual(build_variants(name), [variant_name(name, 200, 'webp')])
+        self.assertEqual(build_variants(name), [])
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name, IMAGE_VARIANT_FORMATS=('webp',))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Let variant builds for uploads finish before the directory goes
+        self.addCleanup(lambda: _executor.submit(lambda: None).result())
+        self.media = media.name
+
+    def photo(self, colour):
+        buffer = BytesIO()
+        Image.new('RGB', (100, 100), colour).save(buffer, format='PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+    def item(self, image):
+        return MenuItem.objects.create(name='Soup', price=90, category='Bites', image=image)
+
+    def test_identical_uploads_share_one_blob(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first, second = self.item(self.photo('red')), self.item(self.photo('red'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_blob_name(first.image.name))
+        self.assertEqual(len(os.listdir(os.path.join(self.media, 'images'))), 1)
+        self.assertEqual(refcount(first.image.name), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(content_storage.exists(second.image.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(content_storage.exists(second.image.name))
+
+    def test_upload_in_flight_keeps_the_blob(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.item(self.photo('red'))
+        name = first.image.name
+        # Another upload of the same bytes has stored its file, not yet its row
+        self.assertEqual(content_storage.save('images/photo.png', self.photo('red')), name)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(content_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.item(name)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(content_storage.exists(name))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_replaced_photo_is_released(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.item(self.photo('red'))
+        old = item.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            item.image = self.photo('blue')
+            item.save()
+        self.assertNotEqual(item.image.name, old)
+        self.assertFalse(content_storage.exists(old))
+
+    def test_gc_rehashes_legacy_uploads_and_sweeps_orphans(self):
+        legacy = default_storage.save('images/soup.png', self.photo('red'))
+        copy = default_storage.save('images/soup.png', self.photo('red'))
+        orphan = default_storage.save('images/old.png', self.photo('green'))
+        with self.captureOnCommitCallbacks(execute=True):
+            first, second = self.item(legacy), self.item(copy)
+
+        call_command('gc_media', rehash=True, min_age=0, stdout=StringIO())
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_blob_name(first.image.name))
+        self.assertEqual(os.listdir(os.path.join(self.media, 'images')), [os.path.basename(first.image.name)])
+        self.assertFalse(default_storage.exists(orphan))
+
+    def test_blobs_are_served_immutable(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.item(self.photo('red'))
+        default_storage.save('images/legacy.png', self.photo('red'))
+        request = RequestFactory().get('/')
+
+        response = serve_media(request, item.image.name, document_root=self.media)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertNotIn('Cache-Control', serve_media(request, 'images/legacy.png', document_root=self.media))
+
+
+class StaticPipelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # One collectstatic for the class: compressing every asset is slow
+        root = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(root.cleanup)
+        settings = override_settings(STATIC_ROOT=root.name)
+        settings.enable()
+        cls.addClassCleanup(settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        cls.root = root.name
+
+    def setUp(self):
+        self.app = StaticFilesApp(self.django_app, root=self.root)
+        self.hashed = staticfiles_storage.stored_name('css/casa.css')
+
+    def django_app(self, environ, start_response):
+        start_response('404 Not Found', [])
+        return [b'django']
+
+    def get(self, path, **environ):
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, **environ}
+        response = {}
+
+        def start_response(status, headers):
+            response.update(headers, status=status)
+
+        body = b''.join(self.app(environ, start_response))
+        return response, body
+
+    def test_fingerprinted_assets_are_immutable_and_precompressed(self):
+        self.assertNotEqual(self.hashed, 'css/casa.css')
+        response, body = self.get('/static/' + self.hashed, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['status'], '200 OK')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        with staticfiles_storage.open(self.hashed) as original:
+            self.assertEqual(gzip.decompress(body), original.read())
+
+        again, body = self.get('/static/' + self.hashed, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((again['status'], body), ('304 Not Modified', b''))
+
+    def test_unhashed_and_unknown_paths(self):
+        response, _ = self.get('/static/css/casa.css', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('must-revalidate', response['Cache-Control'])
+
+        response, body = self.get('/static/css/missing.css')
+        self.assertEqual(body, b'django')
+
+
+@override_settings(PAGE_ETAG_WINDOW=10 ** 9)
+class ResponseCompressionTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.client.force_login(User.objects.create_superuser('owner', password='secret'))
+
+    def test_dashboard_is_compressed_and_revalidated(self):
+        response = self.client.get(reverse('admin_dashboard'), headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn(b'<html', gzip.decompress(response.content))
+
+        with self.assertNumQueries(1):
+            # Only the user; nothing the page is built from
+            again = self.client.get(reverse('admin_dashboard'), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Employee.objects.create(name='Asha', date_of_birth='2000-01-01', staff='Kitchen', employment_type='Full-Time', phno='1')
+        again = self.client.get(reverse('admin_dashboard'), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 200)
+
+    def test_small_and_streamed_responses_are_left_alone(self):
+        response = self.client.get(reverse('check_payment_status'), headers={'Accept-Encoding': 'gzip'})
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get(reverse('event_stream'), headers={'Accept-Encoding': 'gzip'})
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response.close()
+
+
+class SharedCacheTests(TestCase):
+    def test_culling_keeps_version_tokens(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shared = VersionFileCache(directory, {'OPTIONS': {'MAX_ENTRIES': 20, 'CULL_FREQUENCY': 2}})
+            shared.set('catalog:version', 'v1', None)
+            shared.set('order:1:version', 'soon', 1)
+            for n in range(100):
+                shared.add(f'order:{n + 2}:version', n, 60)
+            self.assertEqual(shared.get('catalog:version'), 'v1')
+            self.assertIsNone(shared.get('order:1:version'))
+            self.assertLessEqual(len(shared._list_cache_files()), 20)
+
+    def test_tests_do_not_touch_the_live_cache_directory(self):
+        self.assertFalse(caches['shared']._dir.startswith(str(settings.BASE_DIR)))
@@ -13,6 +13,7 @@ urlpatterns = [
     path('admin_bill/<int:payment_id>/', views.admin_bill, name='admin_bill'),
     path('ok_in_admin/<int:payment_id>/', views.ok_in_admin, name='ok_in_admin'),
     path('check-order-status/<int:order_id>/', views.check_order_status, name='check_order_status'),
+    path('events/', views.event_stream, name='event_stream'),
     path('mark-order-notified/<int:order_id>/', views.mark_order_notified, name='mark_order_notified'),
     path('add-table-user/', views.add_table_user, name='add_table_user'),
     path("tables/add/", views.add_table_user, name="add_table_user"),
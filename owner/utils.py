@@ -1,12 +1,204 @@
 # utils.py
-import qrcode
-from io import BytesIO
-import base64
-
-def generate_upi_qr(upi_id, name, amount):
-    upi_url = f"upi://pay?pa={upi_id}&pn={name}&am={amount}&cu=INR"
-    qr = qrcode.make(upi_url)
-    buffer = BytesIO()
-    qr.save(buffer, format="PNG")
-    img_base64 = base64.b64encode(buffer.getvalue()).decode()
-    return f"data:image/png;base64,{img_base64}"
+import hashlib
+import time
+import uuid
+from functools import wraps
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import parse_etags
+from .models import Order, OrderItem
+
+# Order counters are shared by every kitchen and admin screen for this long
+ORDER_COUNTERS_KEY = 'order:counters'
+ORDER_COUNTERS_TTL = 1
+
+# Per-order version tokens behind the order status ETag, kept for a day
+ORDER_VERSION_KEY = 'order:{}:version'
+ORDER_VERSION_TTL = 24 * 60 * 60
+
+# Version of a kind of data the pages are built from: 'orders', 'payments',
+# 'employees', 'tables', and the menu catalog and charges keys
+DATA_VERSION_KEY = '{}:version'
+
+def set_session(session, key, value):
+    """
+    Store ``value`` in the session only if it differs from what is there, so
+    a page view that changes nothing costs no django_session write.
+    """
+    if key not in session or session[key] != value:
+        session[key] = value
+
+
+def station_for_category(category):
+    """Kitchen station that cooks a menu category (see KITCHEN_STATIONS)."""
+    for station, categories in settings.KITCHEN_STATIONS.items():
+        if category in categories:
+            return station
+    return None
+
+
+def order_counters(station=None):
+    """
+    Pending / preparing / delivered counters for the kitchen and admin boards,
+    computed in one conditional-aggregation query and shared through the cache
+    for ORDER_COUNTERS_TTL seconds. Saving an order drops the snapshot.
+
+    With a kitchen ``station`` only orders with lines for that station count,
+    and an order is pending while the station still has lines to cook.
+    """
+    key = f"{ORDER_COUNTERS_KEY}:{station}" if station else ORDER_COUNTERS_KEY
+    counters = cache.get(key)
+    if counters is None:
+        today = timezone.now().date()
+        if station is None:
+            counters = Order.objects.aggregate(
+                pending_count=Count('id', filter=Q(status='Accept', removed=False)),
+                preparing_count=Count('id', filter=Q(status='Ready', removed=False)),
+                delivered_count=Count('id', filter=Q(status='Delivered', removed=False)),
+                completed_count=Count('id', filter=Q(status='Delivered', created_at__date=today)),
+            )
+        else:
+            lines = OrderItem.objects.filter(item__category__in=settings.KITCHEN_STATIONS[station])
+            counters = lines.aggregate(
+                pending_count=Count('order', distinct=True, filter=Q(
+                    order__status='Accept', order__removed=False, prepared=False)),
+                open_count=Count('order', distinct=True, filter=Q(
+                    order__status__in=['Accept', 'Ready'], order__removed=False)),
+                delivered_count=Count('order', distinct=True, filter=Q(
+                    order__status='Delivered', order__removed=False)),
+                completed_count=Count('order', distinct=True, filter=Q(
+                    order__status='Delivered', order__created_at__date=today)),
+            )
+            # Orders this station has finished its part of
+            counters['preparing_count'] = counters.pop('open_count') - counters['pending_count']
+        cache.set(key, counters, ORDER_COUNTERS_TTL)
+    return counters
+
+
+def invalidate_order_counters():
+    cache.delete_many(
+        [ORDER_COUNTERS_KEY] + [f"{ORDER_COUNTERS_KEY}:{station}" for station in settings.KITCHEN_STATIONS]
+    )
+
+
+def shared_version(key):
+    """
+    Version token stored under ``key`` in the 'shared' cache, which every
+    worker process sees. Processes compare it with the version of whatever
+    they hold in memory.
+    """
+    shared = caches['shared']
+    version = shared.get(key)
+    if version is None:
+        # First reader after a cache flush; add() keeps a concurrent bump
+        shared.add(key, uuid.uuid4().hex, None)
+        version = shared.get(key)
+    return version
+
+
+def bump_shared_version(key):
+    """
+    Move ``key`` on to a new version once the current transaction commits, so
+    no process reloads data that is about to change. A random token rather
+    than a counter: two bumps can never land on the same value.
+    """
+    transaction.on_commit(lambda: caches['shared'].set(key, uuid.uuid4().hex, None))
+
+
+def order_version(order_id):
+    """The order's current version token, or None if it is not cached yet."""
+    return caches['shared'].get(ORDER_VERSION_KEY.format(order_id))
+
+
+async def aorder_version(order_id):
+    return await caches['shared'].aget(ORDER_VERSION_KEY.format(order_id))
+
+
+def new_order_version(order_id):
+    """Start a version for an order read from the database; keeps one set concurrently."""
+    shared = caches['shared']
+    key = ORDER_VERSION_KEY.format(order_id)
+    shared.add(key, uuid.uuid4().hex, ORDER_VERSION_TTL)
+    return shared.get(key)
+
+
+def bump_order_versions(order_ids):
+    """Give changed orders new versions; call once the change is committed."""
+    caches['shared'].set_many(
+        {ORDER_VERSION_KEY.format(order_id): uuid.uuid4().hex for order_id in order_ids},
+        ORDER_VERSION_TTL,
+    )
+    # Pages listing orders go stale with any of them
+    caches['shared'].set(DATA_VERSION_KEY.format('orders'), uuid.uuid4().hex, None)
+
+
+def order_etag(order_id, version):
+    return f'"{order_id}-{version}"'
+
+
+def etag_matches(request, etag):
+    """
+    Whether the request's If-None-Match holds ``etag``. Compared weakly: the
+    compression middleware sends compressed responses with a weak ETag.
+    """
+    known = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in known or etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in known}
+
+
+def bump_data_version(*names):
+    for name in names:
+        bump_shared_version(DATA_VERSION_KEY.format(name))
+
+
+def data_versions(names):
+    """Current version tokens of the named data, with one cache round trip when warm."""
+    keys = [DATA_VERSION_KEY.format(name) for name in names]
+    versions = caches['shared'].get_many(keys)
+    return [versions.get(key) or shared_version(key) for key in keys]
+
+
+def versioned_etag(*names, vary=()):
+    """
+    Page view decorator: the ETag is worked out from the versions of the data
+    ``names`` the page is built from, so a GET that sends the current one back
+    gets a 304 before any query or template rendering runs.
+
+    The ETag also covers the user, their CSRF cookie, the full path, anything
+    in ``vary`` (callables taking the request) and the current
+    PAGE_ETAG_WINDOW, which bounds how long time-based parts of the page can
+    go stale. Pages with messages waiting are always rendered.
+    """
+    def etag(request):
+        if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+            return None
+        parts = data_versions(names) + [
+            str(request.user.pk),
+            request.META.get('CSRF_COOKIE', ''),
+            request.get_full_path(),
+            str(int(time.time() // settings.PAGE_ETAG_WINDOW)),
+        ]
+        parts += [str(part(request)) for part in vary]
+        return '"%s"' % hashlib.sha1('|'.join(parts).encode()).hexdigest()[:20]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            tag = etag(request)
+            response = tag and get_conditional_response(request, etag=tag)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                # Worked out again after the view, so whatever it stored in the
+                # session counts, as it will for the next request
+                tag = etag(request) if response.status_code == 200 else None
+            if tag and not response.has_header('ETag'):
+                response.headers['ETag'] = tag
+                # Revalidate every time; an unchanged page costs a 304
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -1,15 +1,22 @@
+import asyncio
+import time
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
-from .models import MenuItem, Order, OrderItem, Payment, Charges, Employee
+from .models import MenuItem, Order, OrderItem, Payment, Charges, Employee, VisitBill
 from django.contrib import messages
 from collections import defaultdict
-from .utils import generate_upi_qr
+from .utils import (
+    aorder_version, etag_matches, new_order_version, order_counters, order_etag, set_session,
+    versioned_etag,
+)
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_http_methods
 from datetime import datetime
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.urls import reverse
 from .forms import TableUserForm
 from django.contrib.auth.models import User, Group
@@ -17,6 +24,17 @@ from .forms import TablePasswordResetForm
 from datetime import timedelta
 from django.contrib.sessions.models import Session
 from django.db.models import Count, Sum, Q
+from .events import bus, table_channel
+from .storage import is_blob_name
+from django.views.static import serve
+
+# Seconds between keep-alive comments on an idle event stream
+EVENT_KEEPALIVE = 15
+
+# Long-poll requests to check_order_status wait at most this long for a
+# change, re-reading the order version this often (seconds)
+ORDER_POLL_MAX_WAIT = 25
+ORDER_POLL_STEP = 0.5
 
 
 
@@ -80,6 +98,12 @@ def secure_admin_logout(request):
     return JsonResponse({"success": False}, status=400)
 
 
+def dashboard_state(request):
+    # Choices the dashboard remembers in the session; a 304 must not skip storing them
+    return [request.session.get(key) for key in ('category', 'page', 'staff', 'last_set_sub')]
+
+
+@versioned_etag('orders', 'payments', 'catalog', 'charges', 'employees', 'tables', vary=[dashboard_state])
 def admin_dashboard(request):
     category = request.GET.get('category', 'all')
     search_query = request.POST.get('q', '').strip()
@@ -95,7 +119,7 @@ def admin_dashboard(request):
     else:
         items = MenuItem.objects.none()
 
-    request.session['category'] = category
+    set_session(request.session, 'category', category)
 
     # Apply search filter if q exists
     if search_query:
@@ -142,11 +166,11 @@ def admin_dashboard(request):
 
     
     page = request.GET.get('page')
-    request.session['page'] = page
+    set_session(request.session, 'page', page)
 
     set_sub = request.GET.get('set_sub')
     if set_sub:
-        request.session["last_set_sub"] = set_sub
+        set_session(request.session, "last_set_sub", set_sub)
     else:
         set_sub = request.session.get("last_set_sub", "table") 
 
@@ -194,7 +218,7 @@ def admin_dashboard(request):
 
     employees = Employee.objects.all()
 
-    request.session['staff'] = staff_filter
+    set_session(request.session, 'staff', staff_filter)
 
     if staff_filter == "Dining":
         employees = employees.filter(staff="Dining", is_active=True)
@@ -232,10 +256,11 @@ def admin_dashboard(request):
 
 
     total_orders = orders.count()
-    accepted_count = orders.filter(status='Accept').count()
-    ready_count = orders.filter(status='Ready').count()
-    delivered_count = orders.filter(status='Delivered').count()
-    pending_orders = orders.filter(status__in=['Accept', 'Ready']).count()
+    counters = order_counters()
+    accepted_count = counters['pending_count']
+    ready_count = counters['preparing_count']
+    delivered_count = counters['delivered_count']
+    pending_orders = accepted_count + ready_count
     cash_payments = Payment.objects.filter(payment_method=Payment.CASH, is_paid=True).count()
     online_payments = Payment.objects.filter(payment_method=Payment.ONLINE, is_paid=True).count()
     pending_payments = Payment.objects.filter(is_paid=False).count()
@@ -352,7 +377,6 @@ def check_payment_status(request):
             'bill_date': payment.bill_date,
             'bill_time': payment.bill_time
         })
-        request.session['data'] = data
 
     return JsonResponse({'payments': data})
 
@@ -361,18 +385,42 @@ def admin_bill(request, payment_id):
         # ✅ now read from URL instead of session
     payment = get_object_or_404(Payment, id=payment_id)
 
-    order = payment.order  # ✅ Direct link to Order
-    items = order.items.select_related("item")
+    # The same running bill the customer's bill page reads
+    bill = VisitBill.objects.filter(table_number=payment.table_number, session_id=payment.session_id).first()
+    if bill:
+        summarized_items = bill.items()
+        totals = bill
+    else:
+        summarized_items = summarize_order(payment.order)
+        totals = payment
 
-   # Summarize items
+    payment.notified = True
+    payment.save()
+
+    return render(request, 'pay_confirm.html', {
+        'items_summary': summarized_items,
+        'table': payment.table_number,
+        'bill_number': payment.bill_number,
+        'bill_date': payment.bill_date,
+        'bill_time': payment.bill_time,
+        'subtotal': totals.subtotal,
+        'tax': totals.tax,
+        'service_charge': totals.service_charge,
+        'total': totals.total,
+    })
+
+
+def summarize_order(order):
+    # Items of a payment's order grouped by menu item, for payments made
+    # before visits kept a running bill
     grouped_items = defaultdict(lambda: {'qty': 0, 'price': 0, 'name': ''})
-    for order_item in items:
+    for order_item in order.items.select_related("item") if order else ():
         item = order_item.item
         grouped_items[item.id]['qty'] += order_item.quantity
         grouped_items[item.id]['price'] = item.price
         grouped_items[item.id]['name'] = item.name
 
-    summarized_items = [
+    return [
         {
             'name': v['name'],
             'price': v['price'],
@@ -382,21 +430,6 @@ def admin_bill(request, payment_id):
         for v in grouped_items.values()
     ]
 
-    payment.notified = True
-    payment.save()
-
-    return render(request, 'pay_confirm.html', {
-        'items_summary': summarized_items,
-        'table': payment.table_number,
-        'bill_number': payment.bill_number,
-        'bill_date': payment.bill_date,
-        'bill_time': payment.bill_time,
-        'subtotal': payment.subtotal,
-        'tax': payment.tax,
-        'service_charge': payment.service_charge,
-        'total': payment.total,
-    })
-
 
 def ok_in_admin(request, payment_id):
     payments = get_object_or_404(Payment, id=payment_id)
@@ -407,17 +440,89 @@ def ok_in_admin(request, payment_id):
     page = request.session.get('page')
     return redirect(f"{reverse('admin_dashboard')}?page={page}")
 
-def check_order_status(request, order_id):
+async def check_order_status(request, order_id):
+    # Conditional GET: the ETag carries the order's version, so a poll that
+    # sends back the current one gets a 304 from the cache alone. With
+    # ?wait=<seconds> an unchanged poll is held until the version moves on or
+    # the wait runs out (long-poll; best served by the ASGI entry point).
+    def unchanged(version):
+        return version is not None and etag_matches(request, order_etag(order_id, version))
+
     try:
-        order = Order.objects.get(id=order_id)
-        data = {
-            'status': order.status,
-            'is_notified': order.is_notified,
-        }
-        return JsonResponse(data)
-    except Order.DoesNotExist:
-        return JsonResponse({'error': 'Order not found'}, status=404)
-    
+        wait = min(max(float(request.GET.get('wait', 0)), 0), ORDER_POLL_MAX_WAIT)
+    except ValueError:
+        wait = 0
+
+    version = await aorder_version(order_id)
+    if unchanged(version) and wait:
+        deadline = time.monotonic() + wait
+        while unchanged(version):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(ORDER_POLL_STEP, remaining))
+            version = await aorder_version(order_id)
+
+    if unchanged(version):
+        response = HttpResponse(status=304)
+    else:
+        # The version is settled before the read: a change committing after it
+        # bumps the version, so this response's ETag cannot outlive the status
+        if version is None:
+            version = await sync_to_async(new_order_version)(order_id)
+        order = await Order.objects.filter(id=order_id).values('status', 'is_notified').afirst()
+        if order is None:
+            return JsonResponse({'error': 'Order not found'}, status=404)
+        response = JsonResponse(order)
+
+    response['ETag'] = order_etag(order_id, version)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+async def event_stream(request):
+    # Server-Sent Events need a connection held open, which only the ASGI entry
+    # point can do. 204 tells EventSource to stop retrying; screens keep polling.
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=403)
+
+    if user.is_superuser or await user.groups.filter(name='Kitchen').aexists():
+        channels = set(request.GET.getlist('channel'))
+    else:
+        # Table logins only ever hear about their own table
+        try:
+            channels = {table_channel(int(user.username.replace('table', '')))}
+        except ValueError:
+            return HttpResponse(status=403)
+
+    if not channels:
+        return HttpResponse(status=400)
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+
+    async def stream():
+        subscription = bus.subscribe(channels, last_event_id=last_event_id)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                event = await subscription.get(timeout=EVENT_KEEPALIVE)
+                yield event.encode() if event else ': keep-alive\n\n'
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 from django.views.decorators.csrf import csrf_exempt
 
 @csrf_exempt
@@ -471,7 +576,8 @@ def force_logout_user(request, user_id):
     for session in sessions:
         data = session.get_decoded()
         if data.get('_auth_user_id') == str(user.id):
-            session.delete()
+            # Through the session engine, so a cached copy goes too
+            request.session.__class__(session.session_key).delete()
             count += 1
 
     if count > 0:
@@ -492,7 +598,8 @@ def force_logout_all_tables(request):
         data = session.get_decoded()
         user_id = data.get('_auth_user_id')
         if user_id and table_users.filter(id=user_id).exists():
-            session.delete()
+            # Through the session engine, so a cached copy goes too
+            request.session.__class__(session.session_key).delete()
             count += 1
 
     messages.success(request, f"Force logged out {count} table(s).")
@@ -603,4 +710,12 @@ def edit_employee(request, employee_id):
         'form': form, 
         'employee': employee,
         'staff_filter': staff_filter
-        })
\ No newline at end of file
+        })
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    # Content-addressed photos never change under their name, so browsers
+    # may keep them for good
+    response = serve(request, path, document_root=document_root, show_indexes=show_indexes)
+    if is_blob_name(path):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
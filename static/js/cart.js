@@ -0,0 +1,154 @@
+// Table cart over the JSON cart API.
+// Add, change quantity, remove, place and cancel each take one small request;
+// the bill is redrawn from the cart the server sends back instead of reloading
+// the page. Without JavaScript the forms still post to the page views.
+// Every call carries its own Idempotency-Key, so the service worker can queue
+// it while offline and send it again later without it taking effect twice.
+(function () {
+    const panel = document.getElementById('cart-panel');
+    if (!panel) {
+        return;
+    }
+
+    const csrf = panel.dataset.csrf;
+    const lines = document.getElementById('cart-lines');
+    const total = document.getElementById('cart-total');
+    const actions = document.querySelectorAll('#cart-actions .cart-action');
+
+    function lineUrl(template, uuid) {
+        return template.replace('LINE', uuid);
+    }
+
+    function post(url, data) {
+        const body = new FormData();
+        Object.keys(data || {}).forEach(key => body.append(key, data[key]));
+        return fetch(url, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': csrf,
+                'X-Requested-With': 'XMLHttpRequest',
+                'Idempotency-Key': crypto.randomUUID(),
+            },
+            body: body,
+        }).then(response => response.json());
+    }
+
+    function showMessage(text, tag) {
+        const message = document.createElement('div');
+        message.className = 'error1 ' + tag;
+        const span = document.createElement('span');
+        span.textContent = text;
+        message.appendChild(span);
+        document.body.appendChild(message);
+        setTimeout(() => message.remove(), 3000);
+    }
+
+    function renderLine(line) {
+        const row = document.createElement('div');
+        row.className = 'bill-row';
+        row.dataset.uuid = line.uuid;
+
+        const name = document.createElement('span');
+        name.textContent = line.name;
+        const quantity = document.createElement('span');
+        const price = document.createElement('span');
+        price.textContent = 'Rs: ' + line.total;
+        row.append(name, quantity, price);
+
+        if (line.ordered) {
+            quantity.textContent = line.quantity;
+            return row;
+        }
+
+        const less = document.createElement('button');
+        less.type = 'button';
+        less.className = 'qty-btn';
+        less.dataset.step = '-1';
+        less.textContent = '-';
+        const more = less.cloneNode();
+        more.dataset.step = '1';
+        more.textContent = '+';
+        quantity.append(less, document.createTextNode(line.quantity), more);
+
+        const remove = document.createElement('form');
+        remove.className = 'cart-remove-form';
+        const button = document.createElement('button');
+        button.className = 'delete-btn';
+        button.textContent = 'X';
+        remove.appendChild(button);
+        row.appendChild(remove);
+        return row;
+    }
+
+    function render(state) {
+        if (state.error) {
+            showMessage(state.error, 'error');
+        }
+        if (state.message) {
+            showMessage(state.message, state.queued ? 'info' : 'success');
+        }
+        if (!state.cart) {
+            return;
+        }
+
+        lines.innerHTML = '';
+        state.cart.forEach(line => lines.appendChild(renderLine(line)));
+        total.textContent = state.totals.total.toFixed(2);
+        panel.style.display = state.cart.length ? '' : 'none';
+        actions.forEach(form => {
+            form.hidden = form.dataset.when !== (state.order_status || '');
+        });
+        if (state.order_id) {
+            document.dispatchEvent(new CustomEvent('cart:placed', {detail: {orderId: state.order_id}}));
+        }
+    }
+
+    // Calls queued while offline, answered once the connection came back
+    document.addEventListener('cart:replayed', event => render(event.detail));
+
+    const addForm = document.getElementById('add-to-cart-form');
+    if (addForm) {
+        addForm.addEventListener('submit', event => {
+            event.preventDefault();
+            post(panel.dataset.addUrl, {
+                item_id: addForm.elements.product_id.value,
+                quantity: addForm.elements.quantity.value || 1,
+            }).then(render);
+            addForm.elements.quantity.value = '';
+        });
+    }
+
+    lines.addEventListener('click', event => {
+        const row = event.target.closest('.bill-row');
+        if (!row) {
+            return;
+        }
+        if (event.target.classList.contains('qty-btn')) {
+            const quantity = parseInt(row.children[1].textContent.replace(/[^0-9]/g, ''), 10);
+            const next = quantity + parseInt(event.target.dataset.step, 10);
+            if (next > 0) {
+                post(lineUrl(panel.dataset.updateUrl, row.dataset.uuid), {quantity: next}).then(render);
+            } else {
+                post(lineUrl(panel.dataset.removeUrl, row.dataset.uuid)).then(render);
+            }
+        }
+    });
+
+    lines.addEventListener('submit', event => {
+        if (event.target.classList.contains('cart-remove-form')) {
+            event.preventDefault();
+            const row = event.target.closest('.bill-row');
+            post(lineUrl(panel.dataset.removeUrl, row.dataset.uuid)).then(render);
+        }
+    });
+
+    actions.forEach(form => {
+        if (!form.dataset.api) {
+            return;
+        }
+        form.addEventListener('submit', event => {
+            event.preventDefault();
+            post(form.dataset.api).then(render);
+        });
+    });
+})();
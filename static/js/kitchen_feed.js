@@ -0,0 +1,255 @@
+// Kitchen board live updates.
+// Fetches the kitchen feed with the last cursor and patches only the cards,
+// totals and counters that changed instead of reloading the whole page.
+// The fetch is triggered by the event stream, or every 5s without one.
+(function () {
+    const board = document.getElementById('kitchen-board');
+    if (!board) {
+        return;
+    }
+
+    const feedUrl = board.dataset.feedUrl;
+    const container = board.querySelector('.orders-container');
+    const cardTemplate = document.getElementById('order-card-template');
+    const totalsBody = document.getElementById('kitchen-totals');
+    const batchesBody = document.getElementById('kitchen-batches');
+    const csrf = board.dataset.csrf;
+    const station = board.dataset.station;
+    let cursor = board.dataset.cursor;
+
+    function renderCard(order) {
+        const card = cardTemplate.content.firstElementChild.cloneNode(true);
+        card.id = 'order-' + order.id;
+        card.dataset.status = order.status;
+        card.querySelector('.order-table').textContent = 'Table ' + order.table_number;
+        card.querySelector('.order-time').textContent = order.created_at;
+
+        const status = card.querySelector('.order-status');
+        status.className = 'order-status ' + order.status_class;
+        status.textContent = order.status;
+
+        const items = card.querySelector('.order-items');
+        items.innerHTML = '';
+        order.items.forEach(item => {
+            const row = document.createElement('div');
+            row.className = 'order-item' + (item.prepared ? ' item-prepared' : '');
+            const name = document.createElement('span');
+            name.textContent = item.name;
+            const qty = document.createElement('span');
+            qty.className = 'item-quantity';
+            qty.textContent = '× ' + item.quantity;
+            row.append(name, qty);
+            items.appendChild(row);
+        });
+
+        card.querySelector('input[name="order_id"]').value = order.id;
+        card.querySelector('input[name="status"]').value = order.status;
+        const button = card.querySelector('button');
+        button.className = order.button_class;
+        button.textContent = order.status;
+        return card;
+    }
+
+    function renderTotals(totals) {
+        totalsBody.innerHTML = '';
+        if (!totals.length) {
+            totalsBody.innerHTML = '<tr><td colspan="3">No active items.</td></tr>';
+            return;
+        }
+        totals.forEach(total => {
+            const row = document.createElement('tr');
+            [total.item_name, total.total_qty, total.tables].forEach(value => {
+                const cell = document.createElement('td');
+                cell.textContent = value;
+                row.appendChild(cell);
+            });
+            totalsBody.appendChild(row);
+        });
+    }
+
+    function renderBatches(batches) {
+        batchesBody.innerHTML = '';
+        if (!batches.length) {
+            batchesBody.innerHTML = '<tr><td colspan="5">No batches to cook.</td></tr>';
+            return;
+        }
+        batches.forEach(batch => {
+            const row = document.createElement('tr');
+            [batch.item_name, batch.quantity, batch.tables, batch.station || ''].forEach(value => {
+                const cell = document.createElement('td');
+                cell.textContent = value;
+                row.appendChild(cell);
+            });
+            const cell = document.createElement('td');
+            const button = document.createElement('button');
+            button.type = 'button';
+            button.className = 'batch-btn';
+            button.dataset.lines = batch.lines.join(',');
+            button.textContent = 'Cooked';
+            cell.appendChild(button);
+            row.appendChild(cell);
+            batchesBody.appendChild(row);
+        });
+    }
+
+    function applyFeed(data) {
+        const live = new Set(data.live);
+
+        // Drop cards for orders that were removed or cancelled
+        container.querySelectorAll('.order-card').forEach(card => {
+            if (!live.has(Number(card.id.replace('order-', '')))) {
+                card.remove();
+            }
+        });
+
+        // Replace changed cards in place, append new ones
+        data.orders.forEach(order => {
+            const card = renderCard(order);
+            const existing = document.getElementById(card.id);
+            if (existing) {
+                existing.replaceWith(card);
+            } else {
+                container.appendChild(card);
+            }
+        });
+
+        if (data.totals) {
+            renderTotals(data.totals);
+        }
+        if (data.batches && batchesBody) {
+            renderBatches(data.batches);
+        }
+        if (data.counters) {
+            Object.entries(data.counters).forEach(([name, value]) => {
+                const el = document.getElementById(name.replace('_', '-'));
+                if (el) {
+                    el.textContent = value;
+                }
+            });
+        }
+        cursor = data.cursor;
+    }
+
+    function poll() {
+        const count = container.querySelectorAll('.order-card').length;
+        const url = new URL(feedUrl, window.location.href);
+        url.searchParams.set('since', cursor);
+        url.searchParams.set('n', count);
+        if (station) {
+            url.searchParams.set('station', station);
+        }
+        fetch(url)
+            .then(response => response.json())
+            .then(applyFeed)
+            .catch(error => console.error('Kitchen feed error:', error));
+    }
+
+    function bulk(action, ids, params) {
+        const body = new URLSearchParams({action: action, ...params});
+        if (station) {
+            body.append('station', station);
+        }
+        ids.forEach(id => body.append('ids', id));
+        return fetch(board.dataset.bulkUrl, {
+            method: 'POST',
+            headers: {'X-CSRFToken': csrf},
+            body: body,
+        })
+            .then(() => poll())
+            .catch(error => console.error('Kitchen action error:', error));
+    }
+
+    // Status buttons progress the order in place; delivered orders are
+    // removed after a short pause
+    container.addEventListener('submit', function (e) {
+        const form = e.target.closest('.status-form');
+        if (!form) {
+            return;
+        }
+        e.preventDefault();
+        const card = form.closest('.order-card');
+        const id = form.querySelector('input[name="order_id"]').value;
+        if (card.dataset.status === 'Delivered') {
+            setTimeout(() => bulk('remove', [id]), 500);
+        } else if (station && card.dataset.status === 'Accept') {
+            // A station only finishes its own lines; the order turns Ready
+            // once every station is done
+            bulk('prepare', [id]);
+        } else {
+            bulk('progress', [id], {expected: card.dataset.status});
+        }
+    });
+
+    // Clear every delivered ticket with one request
+    const clearButton = document.getElementById('clear-delivered');
+    if (clearButton) {
+        clearButton.addEventListener('click', function () {
+            const ids = Array.from(container.querySelectorAll('.order-card[data-status="Delivered"]'))
+                .map(card => card.id.replace('order-', ''));
+            if (ids.length) {
+                bulk('remove', ids);
+            }
+        });
+    }
+
+    // Availability toggles flip the button without reloading the board
+    document.querySelectorAll('.toggle-form').forEach(form => {
+        form.addEventListener('submit', function (e) {
+            e.preventDefault();
+            fetch(form.action, {
+                method: 'POST',
+                headers: {'X-CSRFToken': csrf, 'X-Requested-With': 'XMLHttpRequest'},
+            })
+                .then(response => response.json())
+                .then(data => {
+                    const available = data.delete_status === 1;
+                    const button = form.querySelector('button');
+                    button.style.backgroundColor = available ? 'green' : 'red';
+                    button.querySelector('span').textContent = available ? 'Available' : 'Out of Stock';
+                })
+                .catch(error => console.error('Toggle error:', error));
+        });
+    });
+
+    // Completing a batch marks all its lines cooked in one request
+    if (batchesBody) {
+        batchesBody.addEventListener('click', function (e) {
+            const button = e.target.closest('button[data-lines]');
+            if (!button) {
+                return;
+            }
+            button.disabled = true;
+            const body = new URLSearchParams();
+            button.dataset.lines.split(',').forEach(line => body.append('line', line));
+            fetch(batchesBody.dataset.completeUrl, {
+                method: 'POST',
+                headers: {'X-CSRFToken': csrf},
+                body: body,
+            })
+                .then(() => poll())
+                .catch(error => console.error('Batch error:', error));
+        });
+    }
+
+    // A burst of events (an order and its items) triggers a single poll
+    let scheduled = null;
+    function schedulePoll() {
+        if (!scheduled) {
+            scheduled = setTimeout(() => {
+                scheduled = null;
+                poll();
+            }, 200);
+        }
+    }
+
+    if (window.liveChannel && board.dataset.eventsUrl) {
+        liveChannel(board.dataset.eventsUrl, {
+            'order.created': schedulePoll,
+            'order.updated': schedulePoll,
+            'order.deleted': schedulePoll,
+            'order.items': schedulePoll,
+        }, poll, 5000);
+    } else {
+        setInterval(poll, 5000);
+    }
+})();
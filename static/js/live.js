@@ -0,0 +1,43 @@
+// Live updates over Server-Sent Events with a polling fallback.
+//
+// liveChannel(url, handlers, poll, interval)
+//   url      - event stream url, including ?channel=... filters
+//   handlers - {eventType: function(data)} for the typed events to react to
+//   poll     - fallback refresh, also run once whenever the stream (re)connects
+//   interval - fallback polling interval in ms while there is no stream
+//
+// When the server cannot hold the stream open (plain WSGI, not logged in) it
+// answers 204/403, EventSource gives up and the screen simply keeps polling.
+function liveChannel(url, handlers, poll, interval) {
+    let timer = null;
+
+    function startPolling() {
+        if (!timer) {
+            timer = setInterval(poll, interval);
+        }
+    }
+
+    function stopPolling() {
+        clearInterval(timer);
+        timer = null;
+    }
+
+    startPolling();
+    if (!window.EventSource) {
+        return;
+    }
+
+    const source = new EventSource(url);
+    source.onopen = function () {
+        stopPolling();
+        poll();  // catch up on anything missed while disconnected
+    };
+    source.onerror = function () {
+        startPolling();
+    };
+
+    Object.entries(handlers).forEach(([type, handler]) => {
+        source.addEventListener(type, event => handler(JSON.parse(event.data)));
+    });
+    source.addEventListener('resync', () => poll());
+}
@@ -0,0 +1,27 @@
+// Registers the table tablet's service worker (templates/sw.js).
+//
+// <script src=".../offline.js" data-worker="{% url 'service_worker' %}">
+//
+// Cart calls the worker sends again after a drop come back as 'cart:replayed'
+// events carrying the cart state the server answered with. Coming back online
+// tells the worker to refresh the menu cache and empty its outbox.
+(function () {
+    const script = document.currentScript;
+    if (!('serviceWorker' in navigator) || !script) {
+        return;
+    }
+
+    navigator.serviceWorker.register(script.dataset.worker).catch(error => {
+        console.error('Service worker:', error);
+    });
+
+    navigator.serviceWorker.addEventListener('message', event => {
+        if (event.data && event.data.type === 'replayed') {
+            document.dispatchEvent(new CustomEvent('cart:replayed', {detail: event.data.state}));
+        }
+    });
+
+    window.addEventListener('online', () => {
+        navigator.serviceWorker.ready.then(registration => registration.active.postMessage('online'));
+    });
+})();
@@ -0,0 +1,211 @@
+{% load static %}// Service worker for the table tablet.
+//
+// Menu: the page, assets and images listed in the menu manifest are cached
+// under a cache named after the catalog version ('menu-<version>'); caches of
+// older versions are dropped once the new one is complete. Fingerprinted
+// static files and content-addressed photos never change under their name, so
+// they are answered from the cache without asking the server; other static
+// and media files (unhashed names, as under runserver) are answered from the
+// cache and refreshed from the network for next time. Pages go to the network
+// first and fall back to the cache when it is down or slow.
+//
+// Cart: a cart call that cannot reach the server is stored in the 'outbox'
+// and answered with 202 {queued: true}. The outbox is sent again, in order and
+// with the same Idempotency-Key, when the connection comes back; the server
+// answers a resend with its first response, so nothing is added or ordered
+// twice.
+const MANIFEST_URL = '{% url "menu_manifest" %}';
+const HOME_URL = '{% url "customer_dashboard" %}';
+const CART_URL = '{% url "cart_api" %}';
+const STATIC_PREFIX = '{% get_static_prefix %}';
+const MEDIA_PREFIX = '{% get_media_prefix %}';
+const PAGES = 'pages';
+const ASSETS = 'assets';
+// name.<12 hex>.ext from collectstatic, <sha256>.ext and <sha256>.<w>w.ext for photos
+const IMMUTABLE = /(\.[0-9a-f]{12}|\/[0-9a-f]{64}(\.\d+w)?)\.[a-z0-9]+$/;
+const PAGE_TIMEOUT = 3000;
+
+self.addEventListener('install', event => {
+    event.waitUntil(refreshMenu().catch(() => null).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(self.clients.claim());
+});
+
+self.addEventListener('message', event => {
+    if (event.data === 'online') {
+        event.waitUntil(refreshMenu().catch(() => null).then(replay));
+    }
+});
+
+self.addEventListener('sync', event => {
+    if (event.tag === 'outbox') {
+        event.waitUntil(replay());
+    }
+});
+
+self.addEventListener('fetch', event => {
+    const url = new URL(event.request.url);
+    if (url.origin !== self.location.origin) {
+        return;
+    }
+    if (event.request.method === 'POST' && url.pathname.startsWith(CART_URL)) {
+        event.respondWith(sendOrQueue(event.request));
+    } else if (event.request.method !== 'GET' || url.pathname === MANIFEST_URL) {
+        return;
+    } else if (url.pathname.startsWith(STATIC_PREFIX) || url.pathname.startsWith(MEDIA_PREFIX)) {
+        event.respondWith(IMMUTABLE.test(url.pathname) ? cacheFirst(event.request) : staleWhileRevalidate(event.request));
+    } else if (event.request.mode === 'navigate') {
+        event.respondWith(networkFirst(event.request));
+    }
+});
+
+
+// Menu cache
+
+async function refreshMenu() {
+    const response = await fetch(MANIFEST_URL, {credentials: 'same-origin'});
+    if (!response.ok) {
+        return;
+    }
+    const manifest = await response.json();
+    if (!(await caches.has(manifest.cache))) {
+        const cache = await caches.open(manifest.cache + '-partial');
+        const urls = [...manifest.pages, ...manifest.assets, ...manifest.images];
+        const results = await Promise.allSettled(urls.map(url => cache.add(url)));
+        if (results.some(result => result.status === 'rejected')) {
+            return;  // keep the complete cache we have; the rest is fetched next time
+        }
+        await copyCache(manifest.cache + '-partial', manifest.cache);
+    }
+    for (const name of await caches.keys()) {
+        if (name.startsWith('menu-') && name !== manifest.cache) {
+            await caches.delete(name);
+        }
+    }
+}
+
+async function copyCache(from, to) {
+    const source = await caches.open(from);
+    const target = await caches.open(to);
+    for (const request of await source.keys()) {
+        await target.put(request, await source.match(request));
+    }
+}
+
+async function cacheFirst(request) {
+    const cached = await caches.match(request);
+    return cached || fetch(request);
+}
+
+async function staleWhileRevalidate(request) {
+    const assets = await caches.open(ASSETS);
+    const network = fetch(request).then(response => {
+        if (response.ok) {
+            assets.put(request, response.clone());
+        }
+        return response;
+    });
+    // The refreshed copy first: the menu cache may hold an older one
+    const cached = await assets.match(request) || await caches.match(request);
+    if (cached) {
+        network.catch(() => null);
+        return cached;
+    }
+    return network;
+}
+
+async function networkFirst(request) {
+    const pages = await caches.open(PAGES);
+    const network = fetch(request).then(response => {
+        if (response.ok && !response.redirected) {
+            pages.put(request, response.clone());
+        }
+        return response;
+    });
+    const timeout = new Promise((_, reject) => setTimeout(reject, PAGE_TIMEOUT));
+    try {
+        return await Promise.race([network, timeout]);
+    } catch (error) {
+        const cached = await caches.match(request) || await caches.match(HOME_URL);
+        return cached || network;
+    }
+}
+
+
+// Outbox of cart calls made while offline
+
+function openOutbox() {
+    return new Promise((resolve, reject) => {
+        const open = indexedDB.open('tablet', 1);
+        open.onupgradeneeded = () => open.result.createObjectStore('outbox', {keyPath: 'id', autoIncrement: true});
+        open.onsuccess = () => resolve(open.result);
+        open.onerror = () => reject(open.error);
+    });
+}
+
+function outbox(mode, use) {
+    return openOutbox().then(db => new Promise((resolve, reject) => {
+        const transaction = db.transaction('outbox', mode);
+        const request = use(transaction.objectStore('outbox'));
+        transaction.oncomplete = () => resolve(request && request.result);
+        transaction.onerror = () => reject(transaction.error);
+    }));
+}
+
+async function sendOrQueue(request) {
+    const queued = request.clone();
+    // Calls go out in the order they were made: behind the outbox, if any
+    const waiting = await outbox('readonly', store => store.count());
+    if (!waiting) {
+        try {
+            return await fetch(request);
+        } catch (error) {
+            // offline: queue it below
+        }
+    }
+    const entry = {
+        url: queued.url,
+        // The multipart boundary changes with the new body on replay
+        headers: [...queued.headers.entries()].filter(([name]) => name !== 'content-type'),
+        body: [...(await queued.formData()).entries()],
+    };
+    await outbox('readwrite', store => store.add(entry));
+    if (waiting) {
+        replay();
+    } else if (self.registration.sync) {
+        self.registration.sync.register('outbox').catch(() => null);
+    }
+    return new Response(JSON.stringify({
+        queued: true,
+        message: 'Saved. It will be sent as soon as the connection is back.',
+    }), {status: 202, headers: {'Content-Type': 'application/json'}});
+}
+
+async function replay() {
+    const entries = await outbox('readonly', store => store.getAll());
+    for (const entry of entries) {
+        const body = new FormData();
+        entry.body.forEach(([key, value]) => body.append(key, value));
+        let response;
+        try {
+            response = await fetch(entry.url, {
+                method: 'POST',
+                headers: entry.headers,
+                body: body,
+                credentials: 'same-origin',
+            });
+        } catch (error) {
+            return;  // still offline: keep the rest, in order
+        }
+        if (response.status === 409 && response.headers.has('Retry-After')) {
+            return;  // the first attempt is still running; try again later
+        }
+        await outbox('readwrite', store => store.delete(entry.id));
+        const state = await response.json().catch(() => ({}));
+        for (const client of await self.clients.matchAll()) {
+            client.postMessage({type: 'replayed', state: state});
+        }
+    }
+}